@@ -14,14 +14,70 @@ import os
 import json
 import requests
 import re
+import time
+import threading
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Any, Union, Generator, Iterator
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from pydantic import BaseModel, Field
 from logging import getLogger
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 logger = getLogger(__name__)
 logger.setLevel("DEBUG")
 
+# JSON helpers that use orjson when it is installed and the stdlib otherwise
+def _json_loads(data: bytes) -> Any:
+    return orjson.loads(data) if orjson else json.loads(data)
+
+def _json_bytes(obj: Any) -> bytes:
+    return orjson.dumps(obj) if orjson else json.dumps(obj).encode()
+
+def _json_pretty(obj: Any) -> str:
+    return orjson.dumps(obj, option=orjson.OPT_INDENT_2).decode() if orjson else json.dumps(obj, indent=2)
+
+def _mask_api_key(api_key: str) -> str:
+    return f"{api_key[:4]}...{api_key[-4:]}" if len(api_key) > 8 else "***"
+
+class _LazyJson:
+    """Defer JSON serialization of debug log arguments until a record is emitted"""
+    __slots__ = ("obj",)
+
+    def __init__(self, obj: Any):
+        self.obj = obj
+
+    def __str__(self) -> str:
+        return _json_pretty(self.obj)
+
+# Message patterns, compiled once at import
+# A single pass over the message yields URLs and crawl-ID candidates. The ID branch is a
+# lookahead so overlapping phrases like "check status of <id>" are all seen.
+SCAN_RE = re.compile(
+    r'(?P<url>https?://(?:[-\w.]|(?:%[\da-fA-F]{2}))+)'
+    r'|(?=(?i:(?P<kw>status of|check|crawl|id|job)) (?P<cid>[\w-]+))'
+)
+# Crawl-ID keywords in order of precedence
+ID_KEYWORDS = ("status of", "check", "crawl", "id", "job")
+# Each message is scanned by at most three linear passes (greeting, command, URL/ID scan)
+GREETING_RE = re.compile(r'^(?:hi|hello|hey|start|begin|help)(?:\s|$)', re.IGNORECASE)
+API_KEY_RE = re.compile(r'set api key[:\s]+([a-zA-Z0-9_\-]+)', re.IGNORECASE)
+CMD_RE = re.compile(r'\b(debug on|debug off|debug status|set api key|status|check)\b')
+
+# Crawl status cache: short TTL while a job runs, longer once it has finished
+STATUS_CACHE_TTL = 2.0
+STATUS_CACHE_TERMINAL_TTL = 60.0
+STATUS_CACHE_SIZE = 128
+TERMINAL_STATUSES = ("completed", "failed", "cancelled")
+
+# Upper bound on concurrent status polls, matching the session's connection pool size
+MAX_PARALLEL_STATUS = 10
+
 # Request and Response Models
 class CrawlRequest(BaseModel):
     url: str
@@ -43,6 +99,10 @@ class CrawlResponse(BaseModel):
 class CrawlStatusRequest(BaseModel):
     id: str
     
+class CrawlStatusItem(BaseModel):
+    # Only page metadata is rendered; page content in the response is skipped while parsing
+    metadata: Dict[str, Any] | None = None
+
 class CrawlStatusResponse(BaseModel):
     status: str
     total: int = 0
@@ -50,105 +110,137 @@ class CrawlStatusResponse(BaseModel):
     creditsUsed: int = 0
     expiresAt: str | None = None
     next: str | None = None
-    data: List[Dict[str, Any]] = Field(default_factory=list)
+    data: List[CrawlStatusItem] = Field(default_factory=list)
     error: str | None = None  # For error responses
 
 class FirecrawlClient:
-    def __init__(self, api_key: str, debug: bool = False):
+    def __init__(self, api_key: str, debug: bool = False, timeout: tuple = (5, 30)):
         self.api_key = api_key
+        self._api_key_masked = _mask_api_key(api_key)
         self.base_url = "https://api.firecrawl.dev/v1"
         self.debug = debug
-
-    def headers(self):
-        return {
-            "Authorization": f"Bearer {self.api_key}",
+        # (connect, read) timeout in seconds so a stalled API call cannot hold the worker indefinitely
+        self.timeout = timeout
+        # Recent status responses keyed by crawl ID, as (expires_at, response)
+        self._status_cache: Dict[str, tuple] = {}
+        self._status_cache_lock = threading.Lock()
+        self._headers = {
+            "Authorization": f"Bearer {api_key}",
             "Content-Type": "application/json",
             "X-Origin": "openwebui",
             "X-Origin-Type": "integration",
         }
 
-    def crawl_urls(self, request: CrawlRequest) -> CrawlResponse:
+        # Keep one pooled session so crawl submissions and status polls reuse the same connection
+        self.session = requests.Session()
+        self.session.headers.update(self.headers())
+        # Only status polls are retried: every POST to /crawl starts another billed crawl job
+        retries = Retry(
+            total=3,
+            backoff_factor=0.5,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=["GET"],
+            raise_on_status=False,
+        )
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=MAX_PARALLEL_STATUS, max_retries=retries))
+
+    def close(self):
+        self.session.close()
+
+    def headers(self):
+        return self._headers
+
+    def set_api_key(self, api_key: str):
+        self.api_key = api_key
+        self._api_key_masked = _mask_api_key(api_key)
+        self._headers["Authorization"] = f"Bearer {api_key}"
+        self.session.headers["Authorization"] = self._headers["Authorization"]
+
+    def crawl_urls(self, payload: Dict[str, Any]) -> CrawlResponse:
         endpoint = "/crawl"
         url = f"{self.base_url}{endpoint}"
-        headers = self.headers()
         
         if self.debug:
-            logger.debug(f"Crawl request: {json.dumps(request.model_dump(), indent=2)}")
-            logger.debug(f"Endpoint: {url}")
-            logger.debug(f"Using API key: {self.api_key[:4]}...{self.api_key[-4:] if len(self.api_key) > 8 else ''}")
+            # Only validate the outbound payload against CrawlRequest while debugging
+            logger.debug("Crawl request: %s", CrawlRequest.model_validate(payload))
+            logger.debug("Endpoint: %s", url)
+            logger.debug("Using API key: %s", self._api_key_masked)
         
         try:
-            # Convert the request to a dictionary and then to JSON for better control
-            payload = request.model_dump()
-            
+            # Serialize once and reuse the same bytes for the debug log and the request body
+            body = _json_bytes(payload)
             if self.debug:
-                logger.debug(f"Request payload: {json.dumps(payload, indent=2)}")
+                logger.debug("Request body (%d bytes): %s", len(body), body.decode())
             
-            response = requests.post(url, json=payload, headers=headers)
+            response = self.session.post(url, data=body, timeout=self.timeout)
             
             if self.debug:
-                logger.debug(f"Response status code: {response.status_code}")
-                logger.debug(f"Response headers: {dict(response.headers)}")
-                logger.debug(f"Response content: {response.text}")
+                logger.debug("Response status code: %s", response.status_code)
+                logger.debug("Response headers: %s", response.headers)
+                logger.debug("Response content: %s", response.text)
             
             # Handle 400 errors with more detailed information
             if response.status_code == 400:
                 error_detail = "Unknown error"
                 try:
-                    error_data = response.json()
-                    error_detail = json.dumps(error_data, indent=2)
+                    error_data = _json_loads(response.content)
+                    error_detail = _json_pretty(error_data)
                 except:
                     error_detail = response.text
                 
-                logger.error(f"400 Bad Request Error: {error_detail}")
+                logger.error("400 Bad Request Error: %s", error_detail)
                 raise Exception(f"API returned 400 Bad Request: {error_detail}")
             
             response.raise_for_status()
             
-            response_data = response.json()
+            # Decode the body straight into the model without an intermediate dict
+            crawl_response = CrawlResponse.model_validate_json(response.content)
             if self.debug:
-                logger.debug(f"Response data: {json.dumps(response_data, indent=2)}")
+                logger.debug("Response data: %s", crawl_response)
             
-            return CrawlResponse(**response_data)
+            return crawl_response
         except requests.exceptions.RequestException as e:
             if self.debug:
-                logger.error(f"Request failed: {str(e)}")
-                if hasattr(e, 'response') and e.response:
-                    logger.error(f"Response status code: {e.response.status_code}")
-                    logger.error(f"Response body: {e.response.text}")
+                logger.exception("Request failed: %s", e)
+                if getattr(e, 'response', None) is not None:
+                    logger.error("Response status code: %s", e.response.status_code)
+                    logger.error("Response body: %s", e.response.text)
                     
                     # Try to parse the error response as JSON for more details
                     try:
-                        error_json = e.response.json()
-                        logger.error(f"Error details: {json.dumps(error_json, indent=2)}")
+                        error_json = _json_loads(e.response.content)
+                        logger.error("Error details: %s", _LazyJson(error_json))
                     except:
                         pass
-                        
-                logger.error(traceback.format_exc())
             raise Exception(f"Request failed: {e}")
   
     def get_crawl_status(self, request: CrawlStatusRequest) -> CrawlStatusResponse:
         endpoint = f"/crawl/{request.id}"
         url = f"{self.base_url}{endpoint}"
-        headers = self.headers()
         
         if self.debug:
-            logger.debug(f"Crawl status request for ID: {request.id}")
-            logger.debug(f"Endpoint: {url}")
-            logger.debug(f"Using API key: {self.api_key[:4]}...{self.api_key[-4:] if len(self.api_key) > 8 else ''}")
+            logger.debug("Crawl status request for ID: %s", request.id)
+            logger.debug("Endpoint: %s", url)
+            logger.debug("Using API key: %s", self._api_key_masked)
+        
+        cached = self._status_cache.get(request.id)
+        if cached and cached[0] > time.monotonic():
+            if self.debug:
+                logger.debug("Using cached status for crawl ID: %s", request.id)
+            return cached[1]
         
         try:
-            response = requests.get(url, headers=headers)
+            response = self.session.get(url, timeout=self.timeout)
             
             if self.debug:
-                logger.debug(f"Response status code: {response.status_code}")
-                logger.debug(f"Response headers: {dict(response.headers)}")
-                logger.debug(f"Response content: {response.text}")
+                logger.debug("Response status code: %s", response.status_code)
+                logger.debug("Response headers: %s", response.headers)
+                logger.debug("Response content (%d bytes): %.2000s", len(response.content), response.text)
             
             # Handle error responses (402, 429, 500)
             if response.status_code in [402, 429, 500]:
                 try:
-                    error_data = response.json()
+                    error_data = _json_loads(response.content)
                     error_message = error_data.get("error", "Unknown error")
                     return CrawlStatusResponse(status="error", error=error_message)
                 except:
@@ -156,22 +248,29 @@ class FirecrawlClient:
             
             response.raise_for_status()
             
-            response_data = response.json()
+            status_response = CrawlStatusResponse.model_validate_json(response.content)
             if self.debug:
-                logger.debug(f"Response data summary: Status: {response_data.get('status')}, Total: {response_data.get('total')}, Completed: {response_data.get('completed')}")
-                if 'data' in response_data:
-                    logger.debug(f"Data items: {len(response_data.get('data', []))}")
+                logger.debug("Response data summary: Status: %s, Total: %s, Completed: %s", status_response.status, status_response.total, status_response.completed)
+                logger.debug("Data items: %s", len(status_response.data))
             
-            return CrawlStatusResponse(**response_data)
+            self._cache_status(request.id, status_response)
+            return status_response
         except requests.exceptions.RequestException as e:
             if self.debug:
-                logger.error(f"Request failed: {str(e)}")
-                if hasattr(e, 'response') and e.response:
-                    logger.error(f"Response status code: {e.response.status_code}")
-                    logger.error(f"Response body: {e.response.text}")
-                logger.error(traceback.format_exc())
+                logger.exception("Request failed: %s", e)
+                if getattr(e, 'response', None) is not None:
+                    logger.error("Response status code: %s", e.response.status_code)
+                    logger.error("Response body: %s", e.response.text)
             raise Exception(f"Request failed: {e}")
 
+    def _cache_status(self, crawl_id: str, response: CrawlStatusResponse):
+        ttl = STATUS_CACHE_TERMINAL_TTL if response.status in TERMINAL_STATUSES else STATUS_CACHE_TTL
+        with self._status_cache_lock:
+            if crawl_id not in self._status_cache and len(self._status_cache) >= STATUS_CACHE_SIZE:
+                # Evict the oldest entry to keep the cache bounded
+                self._status_cache.pop(next(iter(self._status_cache)))
+            self._status_cache[crawl_id] = (time.monotonic() + ttl, response)
+
 class Pipeline:
     class Valves(BaseModel):
         FIRECRAWL_API_KEY: str = Field(default="", description="Firecrawl API key")
@@ -191,6 +290,18 @@ class Pipeline:
         MOBILE: bool = Field(default=False, description="Use mobile user agent")
         TIMEOUT: int = Field(default=30000, description="Request timeout in milliseconds")
     
+    # Environment-resolved and type-coerced valve defaults, shared by all instances
+    _valve_defaults: Dict[str, Any] | None = None
+    
+    @classmethod
+    def _resolve_valve_defaults(cls) -> Dict[str, Any]:
+        """Read valve overrides from the environment once per process"""
+        if cls._valve_defaults is None:
+            cls._valve_defaults = cls.Valves(
+                **{k: os.getenv(k, v.default) for k, v in cls.Valves.model_fields.items()}
+            ).model_dump()
+        return cls._valve_defaults
+    
     def __init__(self):
         self.name = "Firecrawl Web Crawling Pipeline"
         
@@ -198,64 +309,99 @@ class Pipeline:
         self._debug = False
         
         # Initialize valve parameters
-        self.valves = self.Valves(
-            **{k: os.getenv(k, v.default) for k, v in self.Valves.model_fields.items()}
-        )
+        self.valves = self.Valves(**self._resolve_valve_defaults())
+        
+        # Last (message, scan result) pair from _scan_message
+        self._last_scan = None
+        
+        # Chat command handlers keyed by the token matched in CMD_RE, in precedence order
+        self._commands = {
+            "set api key": self._set_api_key,
+            "debug on": self._debug_on,
+            "debug off": self._debug_off,
+            "debug status": self._debug_status,
+            "status": self._check_crawl_status,
+            "check": self._check_crawl_status,
+        }
         
         if self._debug:
-            logger.debug(f"Initialized {self.name} with valves: {self.valves.model_dump()}")
+            logger.debug("Initialized %s with valves: %s", self.name, self.valves)
             if not self.valves.FIRECRAWL_API_KEY:
                 logger.warning("FIRECRAWL_API_KEY is not set or empty")
             else:
-                api_key = self.valves.FIRECRAWL_API_KEY
-                logger.debug(f"Using API key: {api_key[:4]}...{api_key[-4:] if len(api_key) > 8 else ''}")
+                logger.debug("Using API key: %s", _mask_api_key(self.valves.FIRECRAWL_API_KEY))
     
     async def on_startup(self):
-        logger.debug(f"on_startup:{self.name}")
+        logger.debug("on_startup:%s", self.name)
         if not self.valves.FIRECRAWL_API_KEY:
             logger.warning("FIRECRAWL_API_KEY not set. Pipeline will not function correctly.")
+        else:
+            self._get_client()
         
         if self._debug:
             logger.debug("Debug mode is enabled. Detailed logs will be shown.")
     
     async def on_shutdown(self):
-        logger.debug(f"on_shutdown:{self.name}")
+        logger.debug("on_shutdown:%s", self.name)
+        if hasattr(self, 'client'):
+            self.client.close()
+    
+    def _get_client(self) -> FirecrawlClient:
+        """Return the shared Firecrawl client, creating it once and following API key changes"""
+        if not hasattr(self, 'client'):
+            self.client = FirecrawlClient(api_key=self.valves.FIRECRAWL_API_KEY, debug=self._debug)
+        elif self.client.api_key != self.valves.FIRECRAWL_API_KEY:
+            self.client.set_api_key(self.valves.FIRECRAWL_API_KEY)
+        return self.client
+    
+    def _scan_message(self, message: str) -> Dict[str, Any]:
+        """Scan the message once for URLs and crawl IDs, reusing the result for the same message"""
+        # pipe() runs on worker threads: read the shared (message, result) pair once so it cannot change between checks
+        last_scan = self._last_scan
+        if last_scan is not None and last_scan[0] == message:
+            return last_scan[1]
+        
+        urls = []
+        ids_by_keyword = {}
+        for match in SCAN_RE.finditer(message):
+            if match.group("url"):
+                urls.append(match.group("url"))
+            else:
+                ids = ids_by_keyword.setdefault(match.group("kw").lower(), [])
+                if match.group("cid") not in ids:
+                    ids.append(match.group("cid"))
+        
+        # IDs come from the highest-precedence keyword present, e.g. every "status of <id>"
+        crawl_ids = next((ids_by_keyword[kw] for kw in ID_KEYWORDS if kw in ids_by_keyword), [])
+        result = {"urls": urls, "crawl_ids": crawl_ids}
+        self._last_scan = (message, result)
+        return result
     
     def _extract_url_from_message(self, message: str) -> str:
-        # Initialize the Firecrawl client
-        self.client = FirecrawlClient(api_key=self.valves.FIRECRAWL_API_KEY, debug=self._debug)
-
         """Extract URL from user message"""
-        url_pattern = r'https?://(?:[-\w.]|(?:%[\da-fA-F]{2}))+'
-        urls = re.findall(url_pattern, message)
+        urls = self._scan_message(message)["urls"]
         
         if self._debug:
-            logger.debug(f"Extracted URLs from message: {urls}")
+            logger.debug("Extracted URLs from message: %s", urls)
         
         return urls[0] if urls else None
     
     def _extract_crawl_id(self, message: str) -> str:
         """Extract crawl ID from user message if present"""
-        id_patterns = [
-            r'status of ([\w-]+)',
-            r'check ([\w-]+)',
-            r'crawl ([\w-]+)',
-            r'id ([\w-]+)',
-            r'job ([\w-]+)'
-        ]
-        
-        for pattern in id_patterns:
-            match = re.search(pattern, message, re.IGNORECASE)
-            if match:
-                crawl_id = match.group(1)
-                if self._debug:
-                    logger.debug(f"Extracted crawl ID: {crawl_id}")
-                return crawl_id
+        crawl_ids = self._extract_crawl_ids(message)
+        return crawl_ids[0] if crawl_ids else None
+    
+    def _extract_crawl_ids(self, message: str) -> List[str]:
+        """Extract all crawl IDs from user message"""
+        crawl_ids = self._scan_message(message)["crawl_ids"]
         
         if self._debug:
-            logger.debug("No crawl ID found in message")
+            if crawl_ids:
+                logger.debug("Extracted crawl IDs: %s", crawl_ids)
+            else:
+                logger.debug("No crawl ID found in message")
         
-        return None
+        return crawl_ids
     
     def _parse_path_list(self, paths_str: str) -> List[str]:
         """Parse comma-separated path list into a list of strings"""
@@ -265,39 +411,131 @@ class Pipeline:
         paths = [p.strip() for p in paths_str.split(',') if p.strip()]
         
         if self._debug:
-            logger.debug(f"Parsed path list: {paths}")
+            logger.debug("Parsed path list: %s", paths)
         
         return paths
     
+    def _set_api_key(self, user_message: str) -> str:
+        """Handle the 'set api key' command"""
+        # Extract API key from message
+        match = API_KEY_RE.search(user_message)
+        if match:
+            new_api_key = match.group(1)
+            self.valves.FIRECRAWL_API_KEY = new_api_key
+            self.client.set_api_key(new_api_key)
+            logger.info("API key updated")
+            return f"API key has been updated. First 4 characters: {new_api_key[:4]}..."
+        else:
+            return "Could not extract API key from message. Format should be: set api key YOUR_API_KEY"
+    
+    def _debug_on(self, user_message: str) -> str:
+        """Handle the 'debug on' command - only for development"""
+        self._debug = True
+        if hasattr(self, 'client'):
+            self.client.debug = True
+        logger.debug("Debug mode enabled")
+        return "Debug mode has been enabled. Detailed logs will now be shown."
+    
+    def _debug_off(self, user_message: str) -> str:
+        """Handle the 'debug off' command - only for development"""
+        self._debug = False
+        if hasattr(self, 'client'):
+            self.client.debug = False
+        logger.debug("Debug mode disabled")
+        return "Debug mode has been disabled."
+    
+    def _debug_status(self, user_message: str) -> str:
+        """Handle the 'debug status' command"""
+        status = "enabled" if self._debug else "disabled"
+        return f"Debug mode is currently {status}."
+    
+    def _check_crawl_status(self, user_message: str) -> str:
+        """Handle a crawl status request, or return None if the message has no crawl ID"""
+        crawl_ids = self._extract_crawl_ids(user_message)
+        if not crawl_ids:
+            return None
+        
+        if len(crawl_ids) == 1:
+            return self._get_crawl_status_message(crawl_ids[0])
+        
+        # Poll several jobs concurrently over the client's pooled session
+        with ThreadPoolExecutor(max_workers=min(len(crawl_ids), MAX_PARALLEL_STATUS)) as executor:
+            status_msgs = list(executor.map(self._get_crawl_status_message, crawl_ids))
+        
+        return "\n".join(f"### Crawl {crawl_id}\n\n{status_msg}" for crawl_id, status_msg in zip(crawl_ids, status_msgs))
+    
+    def _get_crawl_status_message(self, crawl_id: str) -> str:
+        """Fetch the status of one crawl job and format it for display"""
+        try:
+            if self._debug:
+                logger.debug("Checking status for crawl ID: %s", crawl_id)
+            
+            request = CrawlStatusRequest(id=crawl_id)
+            response = self.client.get_crawl_status(request)
+            
+            if self._debug:
+                logger.debug("Crawl status response: %s", response)
+            
+            # Check if there was an error
+            if response.error:
+                return f"Error getting crawl status: {response.error}"
+            
+            # Build status message with the new response format
+            parts = [
+                f"Crawl job status: {response.status}\n\n",
+                f"Total URLs: {response.total}\n",
+                f"Completed: {response.completed}\n",
+                f"Credits used: {response.creditsUsed}\n",
+            ]
+            
+            if response.expiresAt:
+                parts.append(f"Expires at: {response.expiresAt}\n")
+            
+            # Show sample of completed URLs if available
+            if response.data:
+                parts.append("\nList of all crawled pages:\n")
+                for i, item in enumerate(response.data):
+                    meta = item.metadata or {}
+                    parts.append(f"{i+1}. {meta.get('title', 'No title')} - {meta.get('sourceURL', 'Unknown URL')}\n")
+            
+            return "".join(parts)
+        except Exception as e:
+            error_msg = f"Error getting crawl status: {str(e)}"
+            
+            if self._debug:
+                # Format the traceback once and reuse it for the log and the reply
+                tb = traceback.format_exc()
+                logger.error("%s\n%s", error_msg, tb)
+                return f"{error_msg}\n\nDebug traceback:\n{tb}"
+            
+            logger.error(error_msg)
+            return error_msg
+    
     def pipe(
         self, user_message: str, model_id: str, messages: List[dict], body: dict
     ) -> Union[str, Generator, Iterator]:
         """
         Process the user message and perform crawl operation using Firecrawl API
         """
-        logger.debug(f"pipe:{__name__}")
+        logger.debug("pipe:%s", __name__)
         
         if self._debug:
-            logger.debug(f"User message: {user_message}")
-            logger.debug(f"Model ID: {model_id}")
-            logger.debug(f"Body: {json.dumps(body, indent=2)}")
+            logger.debug("User message: %s", user_message)
+            logger.debug("Model ID: %s", model_id)
+            logger.debug("Body: %s", _LazyJson(body))
         
         if body.get("title", False):
             return "Firecrawl Web Crawling Pipeline"
             
         # Check if this is the first message (empty or just contains a greeting)
-        greeting_patterns = [
-            r'^hi$', r'^hello$', r'^hey$', r'^start$', r'^begin$', r'^help$',
-            r'^hi\s', r'^hello\s', r'^hey\s', r'^start\s', r'^begin\s', r'^help\s'
-        ]
-        
-        is_greeting = not user_message or any(re.search(pattern, user_message.lower()) for pattern in greeting_patterns)
+        is_greeting = not user_message or GREETING_RE.match(user_message) is not None
         
         if not user_message or is_greeting:
             welcome_msg = "👋 Hello! Welcome to the Firecrawl Web Crawling Pipeline.\n\n"
             welcome_msg += "You can type the URL of a website you want to crawl, and I'll extract its content for you.\n\n"
             welcome_msg += "For example: https://example.com\n\n"
             welcome_msg += "To check the status of a previous crawl job, type: check status of [job-id]\n\n"
+            welcome_msg += "To check several jobs at once, type: check status of [job-id] and status of [job-id]\n\n"
             welcome_msg += "Happy crawling! 🕸️"
             return welcome_msg
         
@@ -305,83 +543,17 @@ class Pipeline:
         if not self.valves.FIRECRAWL_API_KEY:
             return "Error: FIRECRAWL_API_KEY not set. Please set it in your environment variables."
         
-        # Check if API key command is in the message
-        if "set api key" in user_message.lower():
-            # Extract API key from message
-            api_key_pattern = r'set api key[:\s]+([a-zA-Z0-9_\-]+)'
-            match = re.search(api_key_pattern, user_message, re.IGNORECASE)
-            if match:
-                new_api_key = match.group(1)
-                self.valves.FIRECRAWL_API_KEY = new_api_key
-                self.client.api_key = new_api_key
-                logger.info("API key updated")
-                return f"API key has been updated. First 4 characters: {new_api_key[:4]}..."
-            else:
-                return "Could not extract API key from message. Format should be: set api key YOUR_API_KEY"
-        
-        # Check if debug command is in the message - only for development
-        if "debug on" in user_message.lower():
-            self._debug = True
-            if hasattr(self, 'client'):
-                self.client.debug = True
-            logger.debug("Debug mode enabled")
-            return "Debug mode has been enabled. Detailed logs will now be shown."
+        self._get_client()
         
-        if "debug off" in user_message.lower():
-            self._debug = False
-            if hasattr(self, 'client'):
-                self.client.debug = False
-            logger.debug("Debug mode disabled")
-            return "Debug mode has been disabled."
-        
-        if "debug status" in user_message.lower():
-            status = "enabled" if self._debug else "disabled"
-            return f"Debug mode is currently {status}."
-        
-        # Check if user is requesting crawl status
-        crawl_id = self._extract_crawl_id(user_message)
-        if crawl_id and ("status" in user_message.lower() or "check" in user_message.lower()):
-            try:
-                if self._debug:
-                    logger.debug(f"Checking status for crawl ID: {crawl_id}")
-                
-                request = CrawlStatusRequest(id=crawl_id)
-                response = self.client.get_crawl_status(request)
-                
-                if self._debug:
-                    logger.debug(f"Crawl status response: {response.model_dump()}")
-                
-                # Check if there was an error
-                if response.error:
-                    return f"Error getting crawl status: {response.error}"
-                
-                # Build status message with the new response format
-                status_msg = f"Crawl job status: {response.status}\n\n"
-                status_msg += f"Total URLs: {response.total}\n"
-                status_msg += f"Completed: {response.completed}\n"
-                status_msg += f"Credits used: {response.creditsUsed}\n"
-                
-                if response.expiresAt:
-                    status_msg += f"Expires at: {response.expiresAt}\n"
-                
-                # Show sample of completed URLs if available
-                if response.data and len(response.data) > 0:
-                    status_msg += "\nList of all crawled pages:\n"
-                    for i, item in enumerate(response.data):
-                        url = item.get("metadata", {}).get("sourceURL", "Unknown URL")
-                        title = item.get("metadata", {}).get("title", "No title")
-                        status_msg += f"{i+1}. {title} - {url}\n"
-                
-                return status_msg
-            except Exception as e:
-                error_msg = f"Error getting crawl status: {str(e)}"
-                logger.error(error_msg)
-                
-                if self._debug:
-                    logger.error(traceback.format_exc())
-                    return f"{error_msg}\n\nDebug traceback:\n{traceback.format_exc()}"
-                
-                return error_msg
+        # Dispatch chat commands from a single scan of the lowercased message; when several
+        # commands appear, the first in self._commands wins rather than the first in the text
+        msg_lc = user_message.lower()
+        tokens = set(CMD_RE.findall(msg_lc))
+        command = next((c for c in self._commands if c in tokens), None)
+        if command:
+            result = self._commands[command](user_message)
+            if result is not None:
+                return result
         
         # Extract URL from user message for new crawl
         url = self._extract_url_from_message(user_message)
@@ -395,8 +567,8 @@ class Pipeline:
             exclude_paths = self._parse_path_list(self.valves.EXCLUDE_PATHS)
             
             if self._debug:
-                logger.debug(f"Include paths: {include_paths}")
-                logger.debug(f"Exclude paths: {exclude_paths}")
+                logger.debug("Include paths: %s", include_paths)
+                logger.debug("Exclude paths: %s", exclude_paths)
             
             # Build scrape options
             scrape_options = {
@@ -428,19 +600,11 @@ class Pipeline:
             if exclude_paths:
                 request_data["excludePaths"] = exclude_paths
             
-            # For debugging, show the exact request that will be sent
-            if self._debug:
-                logger.debug(f"Raw request data: {json.dumps(request_data, indent=2)}")
-            
-            request = CrawlRequest(**request_data)
+            # The client logs the exact request body in debug mode
+            response = self.client.crawl_urls(request_data)
             
             if self._debug:
-                logger.debug(f"Created crawl request: {request.model_dump()}")
-            
-            response = self.client.crawl_urls(request)
-            
-            if self._debug:
-                logger.debug(f"Received crawl response: {response.model_dump()}")
+                logger.debug("Received crawl response: %s", response)
             
             # Updated response message to use the correct attributes
             success_status = "successful" if response.success else "failed"
@@ -448,10 +612,12 @@ class Pipeline:
                    f"To check the status later, ask: 'Check status of {response.id}'")
         except Exception as e:
             error_msg = f"Error during crawl operation: {str(e)}"
-            logger.error(error_msg)
             
             if self._debug:
-                logger.error(traceback.format_exc())
-                return f"{error_msg}\n\nDebug traceback:\n{traceback.format_exc()}"
+                # Format the traceback once and reuse it for the log and the reply
+                tb = traceback.format_exc()
+                logger.error("%s\n%s", error_msg, tb)
+                return f"{error_msg}\n\nDebug traceback:\n{tb}"
             
+            logger.error(error_msg)
             return error_msg 
\ No newline at end of file
@@ -14,14 +14,174 @@ import os
 import json
 import requests
 import re
+import hashlib
+import time
+import threading
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Any, Union, Generator, Iterator
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from pydantic import BaseModel, Field
 from logging import getLogger
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 logger = getLogger(__name__)
 logger.setLevel("DEBUG")
 
+# JSON helpers that use orjson when it is installed and the stdlib otherwise
+def _json_loads(data: Union[bytes, str]) -> Any:
+    return orjson.loads(data) if orjson else json.loads(data)
+
+def _json_bytes(obj: Any) -> bytes:
+    return orjson.dumps(obj) if orjson else json.dumps(obj).encode()
+
+def _json_pretty(obj: Any) -> str:
+    return orjson.dumps(obj, option=orjson.OPT_INDENT_2).decode() if orjson else json.dumps(obj, indent=2)
+
+def _find_json_objects(text: str) -> Iterator[str]:
+    """Yield each top-level balanced {...} span in text, ignoring braces inside JSON strings"""
+    depth = 0
+    start = 0
+    in_string = False
+    skip = -1
+    for match in JSON_TOKEN_RE.finditer(text):
+        pos = match.start()
+        if pos == skip:
+            continue
+        char = match.group()
+        if in_string:
+            if char == "\\":
+                skip = pos + 1
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = depth > 0
+        elif char == "{":
+            if depth == 0:
+                start = pos
+            depth += 1
+        elif char == "}" and depth:
+            depth -= 1
+            if depth == 0:
+                yield text[start:pos + 1]
+
+def _body_text(response: requests.Response) -> str:
+    """Decode a Firecrawl response body as UTF-8 without requests' charset detection"""
+    return response.content.decode(errors="replace")
+
+class _LazyJson:
+    """Defer JSON serialization of debug log arguments until a record is emitted"""
+    __slots__ = ("obj",)
+
+    def __init__(self, obj: Any):
+        self.obj = obj
+
+    def __str__(self) -> str:
+        return _json_pretty(self.obj)
+
+# Message patterns, compiled once at import
+# The first branch matches URLs that can be normalized and splits them into parts as it
+# goes; anything else URL-like falls through to the remaining branches and is kept as is
+URL_RE = re.compile(
+    r"(?:(?P<protocol>https?)://)?(?:www\.)?(?P<domain>[a-zA-Z0-9.-]+)(?P<extension>\.[a-zA-Z]{2,})(?P<path>/\S*)?(?!\S)"
+    r"|https?://\S+|www\.\S+|[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}\S*"
+)
+# The ID branch is a lookahead so overlapping phrases like "check status of <id>" are all seen
+EXTRACT_ID_RE = re.compile(r'(?=(?P<kw>status of|check|extract|id|job) (?P<id>[\w-]+))', re.IGNORECASE)
+# Extract-ID keywords in order of precedence
+ID_KEYWORDS = ("status of", "check", "extract", "id", "job")
+# "with prompt" and "using prompt" are already covered by the plain "prompt" pattern
+PROMPT_RES = (
+    re.compile(r'prompt[:\s]+"(.*?)"', re.IGNORECASE),
+    re.compile(r'extract[:\s]+"(.*?)"', re.IGNORECASE),
+)
+SCHEMA_CODE_BLOCK_RE = re.compile(r'```(?:python|json)?\s*\n?([\s\S]*?)\n?```')
+# Characters that matter when looking for balanced JSON objects in free text
+JSON_TOKEN_RE = re.compile(r'[{}"\\]')
+# Line breaks pasted into string values make the JSON invalid; they are dropped on a second try
+LINE_BREAKS_TABLE = str.maketrans("", "", "\r\n")
+GREETING_RE = re.compile(r'^\s*(?:hi|hello|hey|start|begin|help)(?:\s|$)', re.IGNORECASE)
+API_KEY_RE = re.compile(r'set api key[:\s]+([a-zA-Z0-9_\-]+)', re.IGNORECASE)
+CMD_RE = re.compile(r'\b(debug on|debug off|debug status|set api key)\b')
+# Keyword checks, each one alternation matched as a plain substring like the lists they replace
+SCHEMA_INDICATOR_RE = re.compile(r'extract|find|get|retrieve|pull|scrape', re.IGNORECASE)
+RESTART_RE = re.compile(r'restart|start over|reset|begin again')
+# Confirm/decline answers must be whole words so "extraction" or "know" don't count as one
+CONFIRM_RE = re.compile(r'\b(?:yes|proceed|continue|go ahead|extract|start)\b')
+DECLINE_RE = re.compile(r'\b(?:no|change|modify|update|edit)\b')
+# Command prefixes are stripped in this order, each at most once, along with the whitespace after them
+PROMPT_PREFIX_RE = re.compile(
+    r'(?:please\s*)?(?:can you\s*)?(?:could you\s*)?(?:i want to\s*)?(?:i need to\s*)?'
+    r'(?:extract\s*)?(?:find\s*)?(?:get\s*)?(?:retrieve\s*)?(?:from the website\s*)?',
+    re.IGNORECASE,
+)
+
+# Conversations idle for longer than this start over; at most this many are remembered
+CONVERSATION_TTL = 3600.0
+MAX_CONVERSATIONS = 1024
+
+# Conversation state by chat ID, as (expires_at, state). Kept at module level so it outlives
+# Pipeline instances; least recently used conversations are dropped first.
+_conversations: Dict[Any, tuple] = {}
+_conversations_lock = threading.Lock()
+
+def _load_conversation(chat_id: Any) -> Dict[str, Any]:
+    """Return the live state dict for a chat, starting a fresh one if it is unknown or expired"""
+    now = time.monotonic()
+    with _conversations_lock:
+        entry = _conversations.pop(chat_id, None)
+        state = entry[1] if entry and entry[0] > now else {}
+        _conversations[chat_id] = (now + CONVERSATION_TTL, state)
+        while len(_conversations) > MAX_CONVERSATIONS:
+            del _conversations[next(iter(_conversations))]
+    return state
+
+# Upper bound on concurrent status polls and batch submissions, matching the session's connection pool size
+MAX_PARALLEL_STATUS = 10
+
+# Fixed reply text, built once at import
+DEFAULT_PROMPT = "Extract the main content and key information from this webpage."
+SCHEMA_EXAMPLE = {
+    "type": "object",
+    "properties": {
+        "founders": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "name": {
+                        "type": "string"
+                    }
+                },
+                "required": [
+                    "name"
+                ]
+            }
+        }
+    },
+    "required": [
+        "founders"
+    ]
+}
+SCHEMA_EXAMPLE_JSON = _json_pretty(SCHEMA_EXAMPLE)
+# Schemas echoed back to the user are cut off after this many characters
+SCHEMA_ECHO_LIMIT = 500
+WELCOME_MESSAGE = (
+    "👋 Hello! Welcome to the Firecrawl Data Extraction Pipeline.\n\n"
+    "I'll help you extract structured data from websites. To get started, please tell me:\n\n"
+    "1. What you want to extract (e.g., 'Extract the founder's name from a website')\n"
+    "2. The URL(s) of the website(s)\n"
+    "3. The JSON schema for the data structure (must be a valid JSON object)\n\n"
+    "You can also check the status of a previous extraction job by typing: check status of [job-id]\n\n"
+    "To check several jobs at once, type: check status of [job-id] and status of [job-id]\n\n"
+    "Let's begin! What would you like to extract?"
+)
+
 # Request and Response Models
 class ExtractRequest(BaseModel):
     urls: List[str]
@@ -37,9 +197,13 @@ class ExtractResponse(BaseModel):
     success: bool
     id: str
 
-class ExtractStatusRequest(BaseModel):
-    id: str
-    
+class ExtractStatusSummary(BaseModel):
+    # Top-level status fields only; the data payload is skipped while parsing
+    success: bool
+    status: str
+    expiresAt: str | None = None
+    error: str | None = None
+
 class ExtractStatusResponse(BaseModel):
     success: bool
     data: Union[List[Dict[str, Any]], Dict[str, Any]] = Field(default_factory=dict)
@@ -48,130 +212,159 @@ class ExtractStatusResponse(BaseModel):
     error: str | None = None  # For error responses
 
 class FirecrawlClient:
-    def __init__(self, api_key: str, debug: bool = False):
+    def __init__(self, api_key: str, debug: bool = False, timeout: tuple = (5, 30)):
         self.api_key = api_key
         self.base_url = "https://api.firecrawl.dev/v1"
         self.debug = debug
+        # (connect, read) timeout in seconds so a stalled API call cannot hold the worker indefinitely
+        self.timeout = timeout
 
-    def headers(self):
-        return {
-            "Authorization": f"Bearer {self.api_key}",
+        self._headers = {
+            "Authorization": f"Bearer {api_key}",
             "Content-Type": "application/json",
             "X-Origin": "openwebui",
             "X-Origin-Type": "integration",
         }
 
-    def extract_data(self, request: ExtractRequest) -> ExtractResponse:
+        # Keep one pooled session so extract submissions and status checks reuse the same connection
+        self.session = requests.Session()
+        self.session.headers.update(self.headers())
+        # Only status checks are retried: every POST to /extract starts another billed extraction job
+        retries = Retry(
+            total=3,
+            backoff_factor=0.5,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=["GET"],
+            raise_on_status=False,
+        )
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=MAX_PARALLEL_STATUS, max_retries=retries))
+
+    def close(self):
+        self.session.close()
+
+    def headers(self):
+        return self._headers
+
+    def set_api_key(self, api_key: str):
+        self.api_key = api_key
+        self._headers["Authorization"] = f"Bearer {api_key}"
+        self.session.headers["Authorization"] = self._headers["Authorization"]
+
+    def extract_data(self, payload: Dict[str, Any]) -> ExtractResponse:
         endpoint = "/extract"
         url = f"{self.base_url}{endpoint}"
-        headers = self.headers()
         
         if self.debug:
-            logger.debug(f"Extract request: {json.dumps(request.model_dump(), indent=2)}")
-            logger.debug(f"Endpoint: {url}")
-            logger.debug(f"Using API key: {self.api_key[:4]}...{self.api_key[-4:] if len(self.api_key) > 8 else ''}")
+            # Only validate the outbound payload against ExtractRequest while debugging
+            logger.debug("Extract request: %s", ExtractRequest.model_validate(payload))
+            logger.debug("Endpoint: %s", url)
+            logger.debug("Using API key: %s...%s", self.api_key[:4], self.api_key[-4:] if len(self.api_key) > 8 else '')
         
         try:
-            # Convert the request to a dictionary and then to JSON for better control
-            payload = request.model_dump()
-            
             if self.debug:
-                logger.debug(f"Request payload: {json.dumps(payload, indent=2)}")
+                logger.debug("Request payload: %s", _LazyJson(payload))
             
-            response = requests.post(url, json=payload, headers=headers)
+            response = self.session.post(url, data=_json_bytes(payload), timeout=self.timeout)
             
             if self.debug:
-                logger.debug(f"Response status code: {response.status_code}")
-                logger.debug(f"Response headers: {dict(response.headers)}")
-                logger.debug(f"Response content: {response.text}")
+                logger.debug("Response status code: %s", response.status_code)
+                logger.debug("Response headers: %s", response.headers)
+                logger.debug("Response content (%d bytes): %.2000s", len(response.content), _body_text(response))
             
             # Handle error responses (402, 429, 500)
             if response.status_code in [402, 429, 500]:
                 try:
-                    error_data = response.json()
+                    error_data = _json_loads(response.content)
                     error_message = error_data.get("error", "Unknown error")
                     raise Exception(f"API error: {error_message}")
                 except json.JSONDecodeError:
-                    raise Exception(f"Error {response.status_code}: {response.text}")
+                    raise Exception(f"Error {response.status_code}: {_body_text(response)}")
             
             # Handle 400 errors with more detailed information
             if response.status_code == 400:
                 error_detail = "Unknown error"
                 try:
-                    error_data = response.json()
-                    error_detail = json.dumps(error_data, indent=2)
+                    error_data = _json_loads(response.content)
+                    error_detail = _json_pretty(error_data)
                 except:
-                    error_detail = response.text
+                    error_detail = _body_text(response)
                 
-                logger.error(f"400 Bad Request Error: {error_detail}")
+                logger.error("400 Bad Request Error: %s", error_detail)
                 raise Exception(f"API returned 400 Bad Request: {error_detail}")
             
             response.raise_for_status()
             
-            response_data = response.json()
+            # Decode the body straight into the model without an intermediate dict
+            extract_response = ExtractResponse.model_validate_json(response.content)
             if self.debug:
-                logger.debug(f"Response data: {json.dumps(response_data, indent=2)}")
+                logger.debug("Response data: %s", extract_response)
             
-            return ExtractResponse(**response_data)
+            return extract_response
         except requests.exceptions.RequestException as e:
             if self.debug:
-                logger.error(f"Request failed: {str(e)}")
-                if hasattr(e, 'response') and e.response:
-                    logger.error(f"Response status code: {e.response.status_code}")
-                    logger.error(f"Response body: {e.response.text}")
+                logger.exception("Request failed: %s", e)
+                if getattr(e, 'response', None) is not None:
+                    logger.error("Response status code: %s", e.response.status_code)
+                    logger.error("Response body: %s", _body_text(e.response))
                     
                     # Try to parse the error response as JSON for more details
                     try:
-                        error_json = e.response.json()
-                        logger.error(f"Error details: {json.dumps(error_json, indent=2)}")
+                        error_json = _json_loads(e.response.content)
+                        logger.error("Error details: %s", _LazyJson(error_json))
                     except:
                         pass
-                        
-                logger.error(traceback.format_exc())
-            raise Exception(f"Request failed: {e}")
+            raise Exception(f"Request failed: {e}") from e
   
-    def get_extract_status(self, request: ExtractStatusRequest) -> ExtractStatusResponse:
-        endpoint = f"/extract/{request.id}"
+    def get_extract_status(self, extract_id: str) -> ExtractStatusResponse:
+        endpoint = f"/extract/{extract_id}"
         url = f"{self.base_url}{endpoint}"
-        headers = self.headers()
         
         if self.debug:
-            logger.debug(f"Extract status request for ID: {request.id}")
-            logger.debug(f"Endpoint: {url}")
-            logger.debug(f"Using API key: {self.api_key[:4]}...{self.api_key[-4:] if len(self.api_key) > 8 else ''}")
+            logger.debug("Extract status request for ID: %s", extract_id)
+            logger.debug("Endpoint: %s", url)
+            logger.debug("Using API key: %s...%s", self.api_key[:4], self.api_key[-4:] if len(self.api_key) > 8 else '')
         
         try:
-            response = requests.get(url, headers=headers)
+            response = self.session.get(url, timeout=self.timeout)
             
             if self.debug:
-                logger.debug(f"Response status code: {response.status_code}")
-                logger.debug(f"Response headers: {dict(response.headers)}")
-                logger.debug(f"Response content: {response.text}")
+                logger.debug("Response status code: %s", response.status_code)
+                logger.debug("Response headers: %s", response.headers)
+                logger.debug("Response content (%d bytes): %.2000s", len(response.content), _body_text(response))
             
             # Handle error responses (402, 429, 500)
             if response.status_code in [402, 429, 500]:
                 try:
-                    error_data = response.json()
+                    error_data = _json_loads(response.content)
                     error_message = error_data.get("error", "Unknown error")
                     return ExtractStatusResponse(success=False, status="error", error=error_message)
                 except:
-                    return ExtractStatusResponse(success=False, status="error", error=f"Error {response.status_code}: {response.text}")
+                    return ExtractStatusResponse(success=False, status="error", error=f"Error {response.status_code}: {_body_text(response)}")
             
             response.raise_for_status()
             
-            response_data = response.json()
+            # Results are only rendered once the job has completed, so read just the
+            # top-level fields first and leave the data payload unparsed until then
+            summary = ExtractStatusSummary.model_validate_json(response.content)
+            if summary.status != "completed":
+                if self.debug:
+                    logger.debug("Extraction not completed, skipping data: %s", summary)
+                return ExtractStatusResponse(**summary.model_dump())
+            
+            # The status fields were validated above; the extracted data is the caller's
+            # schema-shaped payload, so it is attached without another validation pass
+            data = _json_loads(response.content).get("data") or {}
             if self.debug:
-                logger.debug(f"Response data: {json.dumps(response_data, indent=2)}")
+                logger.debug("Response data: %s", _LazyJson(data))
             
-            return ExtractStatusResponse(**response_data)
+            return ExtractStatusResponse.model_construct(**dict(summary), data=data)
         except requests.exceptions.RequestException as e:
             if self.debug:
-                logger.error(f"Request failed: {str(e)}")
-                if hasattr(e, 'response') and e.response:
-                    logger.error(f"Response status code: {e.response.status_code}")
-                    logger.error(f"Response body: {e.response.text}")
-                logger.error(traceback.format_exc())
-            raise Exception(f"Request failed: {e}")
+                logger.exception("Request failed: %s", e)
+                if getattr(e, 'response', None) is not None:
+                    logger.error("Response status code: %s", e.response.status_code)
+                    logger.error("Response body: %s", _body_text(e.response))
+            raise Exception(f"Request failed: {e}") from e
 
 class Pipeline:
     class Valves(BaseModel):
@@ -189,6 +382,7 @@ class Pipeline:
         TIMEOUT: int = Field(default=30000, description="Request timeout in milliseconds")
         LOCATION_COUNTRY: str = Field(default="US", description="Country for location-based extraction")
         LOCATION_LANGUAGES: str = Field(default="en-US", description="Comma-separated list of languages for extraction")
+        BATCH_SIZE: int = Field(default=0, description="Split extractions into parallel jobs of at most this many URLs (0 = one job for all URLs)")
     
     def __init__(self):
         self.name = "Firecrawl Data Extraction Pipeline"
@@ -201,180 +395,218 @@ class Pipeline:
             **{k: os.getenv(k, v.default) for k, v in self.Valves.model_fields.items()}
         )
         
-        # Conversation state tracking
-        self._conversation_state = {}
+        # Conversation state of the chat handled by the current thread, see _conversation_state
+        self._local = threading.local()
+        
+        # Last (message, scan result) pair from _scan_urls
+        self._last_scan = None
+        
+        # scrapeOptions built by _get_scrape_options and the valve values it was built from
+        self._scrape_options = None
+        self._scrape_options_fingerprint = None
+        
+        # Chat command handlers keyed by the token matched in CMD_RE, in precedence order
+        self._commands = {
+            "set api key": self._set_api_key,
+            "debug on": self._debug_on,
+            "debug off": self._debug_off,
+            "debug status": self._debug_status,
+        }
+        
+        # Conversation steps keyed by which of (prompt, urls, schema) are collected;
+        # any state without a prompt starts from the prompt step
+        self._steps = {
+            (True, False, False): self._await_urls,
+            (True, False, True): self._await_urls,
+            (True, True, False): self._await_schema,
+            (True, True, True): self._ready,
+        }
         
         if self._debug:
-            logger.debug(f"Initialized {self.name} with valves: {self.valves.model_dump()}")
+            logger.debug("Initialized %s with valves: %s", self.name, self.valves)
             if not self.valves.FIRECRAWL_API_KEY:
                 logger.warning("FIRECRAWL_API_KEY is not set or empty")
             else:
                 api_key = self.valves.FIRECRAWL_API_KEY
-                logger.debug(f"Using API key: {api_key[:4]}...{api_key[-4:] if len(api_key) > 8 else ''}")
+                logger.debug("Using API key: %s...%s", api_key[:4], api_key[-4:] if len(api_key) > 8 else '')
+    
+    @property
+    def _conversation_state(self) -> Dict[str, Any]:
+        """State of the conversation being handled; pipe() binds it per call and thread"""
+        state = getattr(self._local, "state", None)
+        if state is None:
+            state = self._local.state = {}
+        return state
     
     async def on_startup(self):
-        logger.debug(f"on_startup:{self.name}")
+        logger.debug("on_startup:%s", self.name)
         if not self.valves.FIRECRAWL_API_KEY:
             logger.warning("FIRECRAWL_API_KEY not set. Pipeline will not function correctly.")
+        else:
+            self._get_client()
         
         if self._debug:
             logger.debug("Debug mode is enabled. Detailed logs will be shown.")
     
     async def on_shutdown(self):
-        logger.debug(f"on_shutdown:{self.name}")
+        logger.debug("on_shutdown:%s", self.name)
+        if hasattr(self, 'client'):
+            self.client.close()
+    
+    def _get_client(self) -> FirecrawlClient:
+        """Return the shared Firecrawl client, creating it once and following API key changes"""
+        if not hasattr(self, 'client'):
+            self.client = FirecrawlClient(api_key=self.valves.FIRECRAWL_API_KEY, debug=self._debug)
+        elif self.client.api_key != self.valves.FIRECRAWL_API_KEY:
+            self.client.set_api_key(self.valves.FIRECRAWL_API_KEY)
+        return self.client
 
-    def _normalize_url(self, url: str) -> str:
+    def _normalize_url(self, match: re.Match) -> str:
         """
-        Normalize the URL by converting the protocol, domain, subdomain, and extension to lowercase.
+        Normalize a URL_RE match by converting the protocol, domain, subdomain, and extension to lowercase.
         Everything else remains unchanged.
         """
+        domain = match.group("domain")
+        if domain is None:
+            return match.group()  # Return as is if it doesn't match
 
-        URL_PATTERN = re.compile(r"^(?:(https?)://)?(?:www\.)?([a-zA-Z0-9.-]+)(\.[a-zA-Z]{2,})(/.*)?$")
-        match = URL_PATTERN.match(url)
-        if not match:
-            return url  # Return as is if it doesn't match
-
-        protocol, domain, extension, path = match.groups()
-        protocol = (protocol or "http").lower()
-        domain = domain.lower()
-        extension = extension.lower()
-        path = path or ""
+        protocol = match.group("protocol")
+        url = match.group()
+        host_end = match.end("extension") - match.start()
+        if protocol and match.start("domain") - match.start() == len(protocol) + 3 and url[:host_end].islower():
+            # Fast path: a lowercase scheme and host without "www." is already normalized
+            normalized_url = url
+        else:
+            extension, path = match.group("extension", "path")
+            protocol = (protocol or "http").lower()
+            domain = domain.lower()
+            extension = extension.lower()
+            path = path or ""
 
-        normalized_url = f"{protocol}://{domain}{extension}{path}"
+            normalized_url = f"{protocol}://{domain}{extension}{path}"
 
         if self._debug:
-            logger.debug(f"Normalized URL: {normalized_url}")
+            logger.debug("Normalized URL: %s", normalized_url)
 
         return normalized_url
     
+    def _scan_urls(self, message: str) -> Dict[str, Any]:
+        """Scan the message once for URLs and the text around them, reusing the result for the same message"""
+        # pipe() runs on worker threads: read the shared (message, result) pair once so it cannot change between checks
+        last_scan = self._last_scan
+        if last_scan is not None and last_scan[0] == message:
+            return last_scan[1]
+        
+        urls = []
+        text_parts = []
+        last_end = 0
+        for match in URL_RE.finditer(message):
+            urls.append(self._normalize_url(match))
+            text_parts.append(message[last_end:match.start()])
+            last_end = match.end()
+        text_parts.append(message[last_end:])
+        
+        if self._debug:
+            logger.debug("Extracted URLs from message: %s", urls)
+        
+        result = {"urls": urls, "text": "".join(text_parts)}
+        self._last_scan = (message, result)
+        return result
+    
     def _extract_urls_from_message(self, message: str) -> List[str]:
         """
         Extract URLs from a user message.
         """
-        url_pattern = re.compile(r"https?://[^\s]+|www\.[^\s]+|(?:[a-zA-Z0-9.-]+\.[a-zA-Z]{2,})[^\s]*")
-        urls = url_pattern.findall(message)
-
-        # Initialize the Firecrawl client
-        self.client = FirecrawlClient(api_key=self.valves.FIRECRAWL_API_KEY, debug=self._debug)
-
-        if self._debug:
-            logger.debug(f"Extracted URLs from message: {urls}")
-
-        return [self._normalize_url(url) for url in urls] if urls else []
+        return self._scan_urls(message)["urls"]
     
     def _extract_extract_id(self, message: str) -> str:
         """Extract extraction ID from user message if present"""
-        id_patterns = [
-            r'status of ([\w-]+)',
-            r'check ([\w-]+)',
-            r'extract ([\w-]+)',
-            r'id ([\w-]+)',
-            r'job ([\w-]+)'
-        ]
-        
-        for pattern in id_patterns:
-            match = re.search(pattern, message, re.IGNORECASE)
-            if match:
-                extract_id = match.group(1)
-                if self._debug:
-                    logger.debug(f"Extracted extract ID: {extract_id}")
-                return extract_id
+        extract_ids = self._extract_extract_ids(message)
+        return extract_ids[0] if extract_ids else None
+    
+    def _extract_extract_ids(self, message: str) -> List[str]:
+        """Extract all extraction IDs from user message"""
+        # Collect candidates per keyword, then take them from the highest-precedence keyword present
+        ids_by_keyword = {}
+        for match in EXTRACT_ID_RE.finditer(message):
+            ids = ids_by_keyword.setdefault(match.group("kw").lower(), [])
+            if match.group("id") not in ids:
+                ids.append(match.group("id"))
+        
+        extract_ids = next((ids_by_keyword[kw] for kw in ID_KEYWORDS if kw in ids_by_keyword), [])
         
         if self._debug:
-            logger.debug("No extract ID found in message")
+            if extract_ids:
+                logger.debug("Extracted extract IDs: %s", extract_ids)
+            else:
+                logger.debug("No extract ID found in message")
         
-        return None
+        return extract_ids
     
     def _extract_prompt_from_message(self, message: str) -> str:
         """Extract prompt from user message"""
         # Look for prompt in quotes
-        prompt_patterns = [
-            r'prompt[:\s]+"(.*?)"',
-            r'extract[:\s]+"(.*?)"',
-            r'with prompt[:\s]+"(.*?)"',
-            r'using prompt[:\s]+"(.*?)"',
-        ]
-        
-        for pattern in prompt_patterns:
-            match = re.search(pattern, message, re.IGNORECASE)
+        for pattern in PROMPT_RES:
+            match = pattern.search(message)
             if match:
                 prompt = match.group(1)
                 if self._debug:
-                    logger.debug(f"Extracted prompt from quotes: {prompt}")
+                    logger.debug("Extracted prompt from quotes: %s", prompt)
                 return prompt
         
-        # If no quoted prompt found, try to extract schema-related instructions
-        schema_indicators = [
-            "extract", "find", "get", "retrieve", "pull", "scrape"
-        ]
-        
-        # Check if message contains schema-related instructions
-        has_schema_indicator = any(indicator in message.lower() for indicator in schema_indicators)
-        
-        if has_schema_indicator:
+        # If no quoted prompt found, check if message contains schema-related instructions
+        if SCHEMA_INDICATOR_RE.search(message):
             # Remove URLs from the message to get a cleaner prompt
-            urls = self._extract_urls_from_message(message)
-            clean_message = message
-            for url in urls:
-                clean_message = clean_message.replace(url, "")
+            clean_message = self._scan_urls(message)["text"]
             
             # Remove common command prefixes
-            prefixes = [
-                "please", "can you", "could you", "i want to", "i need to", 
-                "extract", "find", "get", "retrieve", "from the website"
-            ]
-            
-            for prefix in prefixes:
-                if clean_message.lower().startswith(prefix):
-                    clean_message = clean_message[len(prefix):].strip()
+            prefix_end = PROMPT_PREFIX_RE.match(clean_message).end()
+            if prefix_end:
+                clean_message = clean_message[prefix_end:].strip()
             
             if clean_message:
                 if self._debug:
-                    logger.debug(f"Using message as prompt: {clean_message}")
+                    logger.debug("Using message as prompt: %s", clean_message)
                 return clean_message
         
         # Default generic prompt if nothing specific found
-        default_prompt = "Extract the main content and key information from this webpage."
         if self._debug:
-            logger.debug(f"Using default prompt: {default_prompt}")
+            logger.debug("Using default prompt: %s", DEFAULT_PROMPT)
         
-        return default_prompt
+        return DEFAULT_PROMPT
     
     def _extract_schema_from_message(self, message: str) -> Dict[str, Any]:
         """Extract schema from user message if present"""
         # Try to extract JSON from code blocks or plain text
-        code_block_pattern = r'```(?:python|json)?\s*\n?([\s\S]*?)\n?```'
-        code_blocks = re.findall(code_block_pattern, message)
+        code_blocks = SCHEMA_CODE_BLOCK_RE.findall(message)
 
         if code_blocks:
             for block in code_blocks:
                 # Clean up the block by removing unnecessary spaces and line breaks
                 block = block.strip()
                 try:
-                    schema = json.loads(block)
+                    schema = _json_loads(block)
                     if self._debug:
-                        logger.debug(f"Extracted schema from code block: {json.dumps(schema, indent=2)}")
+                        logger.debug("Extracted schema from code block: %s", _LazyJson(schema))
                     return schema
                 except json.JSONDecodeError:
                     if self._debug:
-                        logger.error(f"Failed to parse JSON from code block: {block}")
-
-        # Try to extract a JSON object from the message
-        json_pattern = r'({[\s\S]*?})'
-        matches = re.findall(json_pattern, message)
+                        logger.error("Failed to parse JSON from code block: %s", block)
 
-        if matches:
-            for match in matches:
-                # Clean up the match by removing unnecessary spaces and line breaks
-                match = match.strip().replace('\n', '').replace('\r', '').replace(' ', '')
+        # Try to extract a JSON object from the message, one balanced {...} span at a time
+        for match in _find_json_objects(message):
+            try:
+                schema = _json_loads(match)
+            except json.JSONDecodeError:
                 try:
-                    schema = json.loads(match)
-                    if self._debug:
-                        logger.debug(f"Extracted schema from JSON: {json.dumps(schema, indent=2)}")
-                    return schema
+                    schema = _json_loads(match.translate(LINE_BREAKS_TABLE))
                 except json.JSONDecodeError:
                     if self._debug:
-                        logger.error(f"Failed to parse JSON from message: {match}")
+                        logger.error("Failed to parse JSON from message: %s", match)
+                    continue
+            if self._debug:
+                logger.debug("Extracted schema from JSON: %s", _LazyJson(schema))
+            return schema
 
         # No longer try to infer schema from message - require proper JSON schema
         return {}
@@ -392,10 +624,223 @@ class Pipeline:
                 location["languages"] = languages
         
         if self._debug:
-            logger.debug(f"Parsed location: {location}")
+            logger.debug("Parsed location: %s", location)
         
         return location
     
+    def _set_api_key(self, user_message: str) -> str:
+        """Handle the 'set api key' command"""
+        # Extract API key from message
+        match = API_KEY_RE.search(user_message)
+        if match:
+            new_api_key = match.group(1)
+            self.valves.FIRECRAWL_API_KEY = new_api_key
+            self.client.set_api_key(new_api_key)
+            logger.info("API key updated")
+            return f"API key has been updated. First 4 characters: {new_api_key[:4]}..."
+        else:
+            return "Could not extract API key from message. Format should be: set api key YOUR_API_KEY"
+    
+    def _debug_on(self, user_message: str) -> str:
+        """Handle the 'debug on' command - only for development"""
+        self._debug = True
+        self.client.debug = True
+        logger.debug("Debug mode enabled")
+        return "Debug mode has been enabled. Detailed logs will now be shown."
+    
+    def _debug_off(self, user_message: str) -> str:
+        """Handle the 'debug off' command - only for development"""
+        self._debug = False
+        self.client.debug = False
+        logger.debug("Debug mode disabled")
+        return "Debug mode has been disabled."
+    
+    def _debug_status(self, user_message: str) -> str:
+        """Handle the 'debug status' command"""
+        status = "enabled" if self._debug else "disabled"
+        return f"Debug mode is currently {status}."
+    
+    def _check_extract_status(self, user_message: str) -> str:
+        """Handle an extraction status request, or return None if the message has no extraction ID"""
+        extract_ids = self._extract_extract_ids(user_message)
+        if not extract_ids:
+            return None
+        
+        if len(extract_ids) == 1:
+            return self._get_extract_status_message(extract_ids[0])
+        
+        # Poll several jobs concurrently over the client's pooled session
+        with ThreadPoolExecutor(max_workers=min(len(extract_ids), MAX_PARALLEL_STATUS)) as executor:
+            status_msgs = list(executor.map(self._get_extract_status_message, extract_ids))
+        
+        return "\n".join(f"### Extraction {extract_id}\n\n{status_msg}" for extract_id, status_msg in zip(extract_ids, status_msgs))
+    
+    def _get_extract_status_message(self, extract_id: str) -> str:
+        """Fetch the status of one extraction job and format it for display"""
+        try:
+            if self._debug:
+                logger.debug("Checking status for extract ID: %s", extract_id)
+            
+            response = self.client.get_extract_status(extract_id)
+            
+            if self._debug:
+                logger.debug("Extract status response: %s", response)
+            
+            # Check if there was an error
+            if response.error:
+                return f"Error getting extraction status: {response.error}"
+            
+            # Format and return the extraction result
+            return self._format_extract_result(dict(response))
+        except Exception as e:
+            error_msg = f"Error getting extraction status: {str(e)}"
+            
+            if self._debug:
+                # Format the traceback once and reuse it for the log and the reply
+                tb = traceback.format_exc()
+                logger.error("%s\n%s", error_msg, tb)
+                return f"{error_msg}\n\nDebug traceback:\n{tb}"
+            
+            logger.error(error_msg)
+            return error_msg
+    
+    def _short_schema(self, schema: Dict[str, Any]) -> str:
+        """Pretty-print a schema for echoing back to the user, shortened if it is long"""
+        schema_json = _json_pretty(schema)
+        if len(schema_json) <= SCHEMA_ECHO_LIMIT:
+            return schema_json
+        digest = hashlib.sha1(schema_json.encode()).hexdigest()[:8]
+        return f"{schema_json[:SCHEMA_ECHO_LIMIT]}\n... (schema {digest}, {len(schema_json)} characters in total)"
+    
+    def _store_schema(self, schema: Dict[str, Any]) -> str:
+        """Store the schema along with the text used to echo it, which is returned"""
+        schema_echo = self._short_schema(schema)
+        self._conversation_state["schema"] = schema
+        self._conversation_state["schema_echo"] = schema_echo
+        return schema_echo
+    
+    def _get_scrape_options(self) -> Dict[str, Any]:
+        """Return the scrapeOptions part of an extract request, rebuilt only when the valves it reads change"""
+        valves = self.valves
+        fingerprint = (
+            valves.DEFAULT_FORMAT, valves.ONLY_MAIN_CONTENT, valves.WAIT_FOR, valves.MOBILE, valves.TIMEOUT,
+            valves.REMOVE_BASE64_IMAGES, valves.BLOCK_ADS, valves.LOCATION_COUNTRY, valves.LOCATION_LANGUAGES,
+        )
+        if fingerprint == self._scrape_options_fingerprint:
+            return self._scrape_options
+        
+        scrape_options = {
+            "formats": [self.valves.DEFAULT_FORMAT],
+            "onlyMainContent": self.valves.ONLY_MAIN_CONTENT,
+            "waitFor": self.valves.WAIT_FOR,
+            "mobile": self.valves.MOBILE,
+            "timeout": self.valves.TIMEOUT,
+            "removeBase64Images": self.valves.REMOVE_BASE64_IMAGES,
+            "blockAds": self.valves.BLOCK_ADS
+        }
+        
+        # Add location if specified
+        location = self._parse_location(self.valves.LOCATION_COUNTRY, self.valves.LOCATION_LANGUAGES)
+        if location:
+            scrape_options["location"] = location
+        
+        self._scrape_options_fingerprint = fingerprint
+        self._scrape_options = scrape_options
+        return scrape_options
+    
+    def _format_confirmation(self, prompt: str, urls: List[str], schema_echo: str) -> str:
+        """Format the summary shown when an extraction is submitted"""
+        return (f"Great! I'll extract the following data:\n\n"
+                f"- Prompt: {prompt}\n"
+                f"- URLs: {', '.join(urls)}\n"
+                f"- Schema: {schema_echo}\n\n"
+                "Processing your request now...")
+    
+    def _submit_extraction(self, prompt: str, urls: List[str], schema: Dict[str, Any]) -> str:
+        """Start an extraction job for the collected prompt, URLs and schema"""
+        schema_echo = self._conversation_state.get("schema_echo") or self._short_schema(schema)
+        confirmation = self._format_confirmation(prompt, urls, schema_echo)
+        
+        # Proceed with extraction
+        try:
+            scrape_options = self._get_scrape_options()
+            
+            # Create request with all parameters
+            request_data = {
+                "urls": urls,
+                "prompt": prompt,
+                "schema": schema,
+                "enableWebSearch": self.valves.ENABLE_WEB_SEARCH,
+                "ignoreSitemap": self.valves.IGNORE_SITEMAP,
+                "includeSubdomains": self.valves.INCLUDE_SUBDOMAINS,
+                "showSources": self.valves.SHOW_SOURCES,
+                "scrapeOptions": scrape_options
+            }
+            
+            batch_size = self.valves.BATCH_SIZE
+            if batch_size > 0 and len(urls) > batch_size:
+                return f"{confirmation}\n\n{self._submit_batches(request_data, batch_size)}"
+            
+            # The client logs and, in debug mode, validates the exact payload it sends
+            response = self.client.extract_data(request_data)
+            
+            if self._debug:
+                logger.debug("Received extract response: %s", response)
+            
+            # Reset conversation state after successful extraction
+            self._conversation_state.clear()
+            
+            # Return success message with extraction ID
+            return (f"{confirmation}\n\nExtraction job started with ID: {response.id}. Status: {'successful' if response.success else 'failed'}\n\n"
+                   f"To check the status and results later, ask: 'Check status of {response.id}'")
+        except Exception as e:
+            error_msg = f"Error during extraction operation: {str(e)}"
+            
+            if self._debug:
+                # Format the traceback once and reuse it for the log and the reply
+                tb = traceback.format_exc()
+                logger.error("%s\n%s", error_msg, tb)
+                return f"{error_msg}\n\nDebug traceback:\n{tb}"
+            
+            logger.error(error_msg)
+            return error_msg
+    
+    def _submit_batches(self, request_data: Dict[str, Any], batch_size: int) -> str:
+        """Submit the URLs of an extract request as parallel jobs of batch_size URLs and summarize them"""
+        urls = request_data["urls"]
+        batches = [urls[i:i + batch_size] for i in range(0, len(urls), batch_size)]
+        
+        def submit(batch: List[str]):
+            try:
+                return self.client.extract_data({**request_data, "urls": batch})
+            except Exception as e:
+                return e
+        
+        with ThreadPoolExecutor(max_workers=min(len(batches), MAX_PARALLEL_STATUS)) as executor:
+            results = list(executor.map(submit, batches))
+        
+        started = [result.id for result in results if not isinstance(result, Exception)]
+        if not started:
+            raise results[0]
+        
+        lines = []
+        for batch, result in zip(batches, results):
+            if isinstance(result, Exception):
+                logger.error("Error during extraction operation for %s: %s", batch, result)
+                lines.append(f"- {', '.join(batch)}: {result}")
+            else:
+                if self._debug:
+                    logger.debug("Received extract response: %s", result)
+                lines.append(f"- {', '.join(batch)}: ID {result.id}. Status: {'successful' if result.success else 'failed'}")
+        
+        # Reset conversation state once at least one job is running
+        self._conversation_state.clear()
+        
+        check = " and ".join(f"status of {extract_id}" for extract_id in started)
+        return (f"Started {len(started)} of {len(batches)} extraction jobs (up to {batch_size} URLs each):\n\n"
+                + "\n".join(lines)
+                + f"\n\nTo check the status and results later, ask: 'Check {check}'")
+    
     def _format_extract_result(self, result: Dict[str, Any]) -> str:
         """Format the extraction result for display"""
         if not result or not result.get("data"):
@@ -406,498 +851,179 @@ class Pipeline:
 
         data = result["data"]
         
-        # Build a formatted response
-        response = f"### Extracted Data\n\n"
+        # Build a formatted response as a list of parts joined once at the end
+        parts = ["### Extracted Data\n\n"]
         
         # Format the extracted data
         if isinstance(data, dict):
             for key, value in data.items():
                 if isinstance(value, (dict, list)):
-                    response += f"**{key}**:\n```json\n{json.dumps(value, indent=2)}\n```\n\n"
+                    parts.append(f"**{key}**:\n```json\n{_json_pretty(value)}\n```\n\n")
                 else:
-                    response += f"**{key}**: {value}\n\n"
+                    parts.append(f"**{key}**: {value}\n\n")
         elif isinstance(data, list):
-            response += "```json\n" + json.dumps(data, indent=2) + "\n```\n\n"
+            parts.append(f"```json\n{_json_pretty(data)}\n```\n\n")
         else:
-            response += str(data) + "\n\n"
+            parts.append(f"{data}\n\n")
         
         # Add status information
         if result.get("status"):
-            response += f"**Status**: {result['status']}\n\n"
+            parts.append(f"**Status**: {result['status']}\n\n")
         
         # Add expiration information
         if result.get("expiresAt"):
-            response += f"**Expires at**: {result['expiresAt']}\n\n"
+            parts.append(f"**Expires at**: {result['expiresAt']}\n\n")
         
         # Add warning if present
         if result.get("warning"):
-            response += f"\n⚠️ **Warning**: {result['warning']}\n"
+            parts.append(f"\n⚠️ **Warning**: {result['warning']}\n")
         
-        return response
+        return "".join(parts)
 
+    def _await_prompt(self, user_message: str, msg_lc: str) -> str:
+        """Step 1: get the prompt (what to extract)"""
+        # Try to extract prompt from the message
+        prompt = self._extract_prompt_from_message(user_message)
+        
+        # If we found a prompt, store it and move to the next step
+        if prompt and prompt != DEFAULT_PROMPT:
+            self._conversation_state["prompt"] = prompt
+            
+            # Check if URLs are also provided in the same message
+            urls = self._extract_urls_from_message(user_message)
+            if urls:
+                self._conversation_state["urls"] = urls
+                
+                # Check if schema is also provided in the same message
+                schema = self._extract_schema_from_message(user_message)
+                if schema:
+                    self._store_schema(schema)
+                    
+                    # We have all the information, proceed with extraction
+                    return self._submit_extraction(prompt, urls, schema)
+                
+                # If we have prompt and URLs but no schema, ask for schema
+                return f"Great! I'll extract: '{prompt}'\n\nNow, please provide ONLY the JSON schema for the data in your next message.\n\nHere's an example schema that would extract an array of founders with their names:\n\n```json\n{SCHEMA_EXAMPLE_JSON}\n```"
+            else:
+                return f"Great! I'll extract: '{prompt}'\n\nNow, please provide the URL(s) of the website(s) you want to extract data from."
+        else:
+            # If no clear prompt was found, ask explicitly
+            return "Please tell me what you want to extract from the website. For example: 'Extract the founder's name' or 'Find product prices and descriptions'."
+    
+    def _await_urls(self, user_message: str, msg_lc: str) -> str:
+        """Step 2: get the URLs"""
+        urls = self._extract_urls_from_message(user_message)
+        if urls:
+            self._conversation_state["urls"] = urls
+            
+            return f"Thanks for the URL(s). Now, please provide ONLY the JSON schema for the data in your next message.\n\nHere's an example schema that would extract an array of founders with their names:\n\n```json\n{SCHEMA_EXAMPLE_JSON}\n```"
+        else:
+            return "I need the URL(s) of the website(s) you want to extract data from. Please provide at least one valid URL."
+    
+    def _await_schema(self, user_message: str, msg_lc: str) -> str:
+        """Step 3: get the schema, then submit"""
+        schema = self._extract_schema_from_message(user_message)
+        
+        # If no schema was found or it's empty, ask explicitly
+        if not schema:
+            return f"I need a valid JSON schema to structure the extracted data. Please provide ONLY the schema JSON in your next message.\n\nHere's an example schema that would extract an array of founders with their names:\n\n```json\n{SCHEMA_EXAMPLE_JSON}\n```\n\nPlease refer to the documentation or the example above for the proper schema format."
+        
+        self._store_schema(schema)
+        
+        # Now we have all required information, confirm and proceed
+        prompt = self._conversation_state["prompt"]
+        urls = self._conversation_state["urls"]
+        
+        return self._submit_extraction(prompt, urls, schema)
+    
+    def _ready(self, user_message: str, msg_lc: str) -> str:
+        """All information collected: take updates, a confirmation or a decline"""
+        # Check if user is providing new URLs
+        urls = self._extract_urls_from_message(user_message)
+        if urls:
+            self._conversation_state["urls"] = urls
+            return f"I've updated the URLs to: {', '.join(urls)}. Do you want to proceed with the extraction using the current prompt and schema?"
+        
+        # Check if user is providing a new schema
+        schema = self._extract_schema_from_message(user_message)
+        if schema:
+            schema_echo = self._store_schema(schema)
+            return f"I've updated the schema to: {schema_echo}. Do you want to proceed with the extraction using the current prompt and URLs?"
+        
+        # Check if user is providing a new prompt
+        prompt = self._extract_prompt_from_message(user_message)
+        if prompt and prompt != DEFAULT_PROMPT:
+            self._conversation_state["prompt"] = prompt
+            return f"I've updated the prompt to: '{prompt}'. Do you want to proceed with the extraction using the current URLs and schema?"
+        
+        # If user confirms or says yes, proceed with extraction
+        if CONFIRM_RE.search(msg_lc):
+            prompt = self._conversation_state["prompt"]
+            urls = self._conversation_state["urls"]
+            schema = self._conversation_state["schema"]
+            
+            return self._submit_extraction(prompt, urls, schema)
+        
+        # If user says no, ask what they want to change
+        if DECLINE_RE.search(msg_lc):
+            return "What would you like to change? You can update the prompt, URLs, or schema."
+        
+        # Default response if we can't determine what the user wants
+        return "I have all the information needed for extraction. Please say 'yes' to proceed, 'no' to make changes, or 'restart' to start over."
+    
     def pipe(
         self, user_message: str, model_id: str, messages: List[dict], body: dict
     ) -> Union[str, Generator, Iterator]:
         """
         Process the user message and perform extraction operation using Firecrawl API
         """
-        logger.debug(f"pipe:{__name__}")
+        logger.debug("pipe:%s", __name__)
         
         if self._debug:
-            logger.debug(f"User message: {user_message}")
-            logger.debug(f"Model ID: {model_id}")
-            logger.debug(f"Body: {json.dumps(body, indent=2)}")
-        
-        # Initialize the Firecrawl client if not already done
-        if not hasattr(self, 'client'):
-            self.client = FirecrawlClient(api_key=self.valves.FIRECRAWL_API_KEY, debug=self._debug)
+            logger.debug("User message: %s", user_message)
+            logger.debug("Model ID: %s", model_id)
+            logger.debug("Body: %s", _LazyJson(body))
         
         if body.get("title", False):
             return "Firecrawl Data Extraction Pipeline"
+        
+        # Pick up where this chat left off, even if an earlier message went to another Pipeline instance
+        chat_id = body.get("chat_id") or (body.get("metadata") or {}).get("chat_id")
+        self._local.state = _load_conversation(chat_id)
             
         # Check if this is the first message (empty or just contains a greeting)
-        greeting_patterns = [
-            r'^hi$', r'^hello$', r'^hey$', r'^start$', r'^begin$', r'^help$',
-            r'^hi\s', r'^hello\s', r'^hey\s', r'^start\s', r'^begin\s', r'^help\s'
-        ]
-        
-        is_greeting = not user_message or any(re.search(pattern, user_message.lower()) for pattern in greeting_patterns)
-        
-        if not user_message or is_greeting:
+        if not user_message or GREETING_RE.match(user_message):
             # Reset conversation state for new conversation
-            self._conversation_state = {}
+            self._conversation_state.clear()
             
-            welcome_msg = "👋 Hello! Welcome to the Firecrawl Data Extraction Pipeline.\n\n"
-            welcome_msg += "I'll help you extract structured data from websites. To get started, please tell me:\n\n"
-            welcome_msg += "1. What you want to extract (e.g., 'Extract the founder's name from a website')\n"
-            welcome_msg += "2. The URL(s) of the website(s)\n"
-            welcome_msg += "3. The JSON schema for the data structure (must be a valid JSON object)\n\n"
-            welcome_msg += "You can also check the status of a previous extraction job by typing: check status of [job-id]\n\n"
-            welcome_msg += "Let's begin! What would you like to extract?"
-            return welcome_msg
+            return WELCOME_MESSAGE
         
         # Check if API key is set
         if not self.valves.FIRECRAWL_API_KEY:
             return "Error: FIRECRAWL_API_KEY not set. Please set it in your environment variables."
         
-        # Check if API key command is in the message
-        if "set api key" in user_message.lower():
-            # Extract API key from message
-            api_key_pattern = r'set api key[:\s]+([a-zA-Z0-9_\-]+)'
-            match = re.search(api_key_pattern, user_message, re.IGNORECASE)
-            if match:
-                new_api_key = match.group(1)
-                self.valves.FIRECRAWL_API_KEY = new_api_key
-                self.client.api_key = new_api_key
-                logger.info("API key updated")
-                return f"API key has been updated. First 4 characters: {new_api_key[:4]}..."
-            else:
-                return "Could not extract API key from message. Format should be: set api key YOUR_API_KEY"
-        
-        # Check if debug command is in the message - only for development
-        if "debug on" in user_message.lower():
-            self._debug = True
-            self.client.debug = True
-            logger.debug("Debug mode enabled")
-            return "Debug mode has been enabled. Detailed logs will now be shown."
+        self._get_client()
         
-        if "debug off" in user_message.lower():
-            self._debug = False
-            self.client.debug = False
-            logger.debug("Debug mode disabled")
-            return "Debug mode has been disabled."
-        
-        if "debug status" in user_message.lower():
-            status = "enabled" if self._debug else "disabled"
-            return f"Debug mode is currently {status}."
+        # Dispatch chat commands from a single scan of the lowercased message; when several
+        # commands appear, the first in self._commands wins rather than the first in the text
+        msg_lc = user_message.lower()
+        tokens = set(CMD_RE.findall(msg_lc))
+        command = next((c for c in self._commands if c in tokens), None)
+        if command:
+            return self._commands[command](user_message)
         
         # Check if user wants to restart the conversation
-        if any(keyword in user_message.lower() for keyword in ["restart", "start over", "reset", "begin again"]):
-            self._conversation_state = {}
+        if RESTART_RE.search(msg_lc):
+            self._conversation_state.clear()
             return "Let's start over. What would you like to extract?"
         
         # Check if user is requesting extraction status
-        extract_id = self._extract_extract_id(user_message)
-        if extract_id and ("status" in user_message.lower() or "check" in user_message.lower()):
-            try:
-                if self._debug:
-                    logger.debug(f"Checking status for extract ID: {extract_id}")
-                
-                request = ExtractStatusRequest(id=extract_id)
-                response = self.client.get_extract_status(request)
-                
-                if self._debug:
-                    logger.debug(f"Extract status response: {response.model_dump()}")
-                
-                # Check if there was an error
-                if response.error:
-                    return f"Error getting extraction status: {response.error}"
-                
-                # Format and return the extraction result
-                return self._format_extract_result(response.model_dump())
-            except Exception as e:
-                error_msg = f"Error getting extraction status: {str(e)}"
-                logger.error(error_msg)
-                
-                if self._debug:
-                    logger.error(traceback.format_exc())
-                    return f"{error_msg}\n\nDebug traceback:\n{traceback.format_exc()}"
-                
-                return error_msg
-        
-        # Handle the conversational flow for extraction
-        # Step 1: Get the prompt (what to extract)
-        if "prompt" not in self._conversation_state:
-            # Try to extract prompt from the message
-            prompt = self._extract_prompt_from_message(user_message)
-            
-            # If we found a prompt, store it and move to the next step
-            if prompt and prompt != "Extract the main content and key information from this webpage.":
-                self._conversation_state["prompt"] = prompt
-                
-                # Check if URLs are also provided in the same message
-                urls = self._extract_urls_from_message(user_message)
-                if urls:
-                    self._conversation_state["urls"] = urls
-                    
-                    # Check if schema is also provided in the same message
-                    schema = self._extract_schema_from_message(user_message)
-                    if schema:
-                        self._conversation_state["schema"] = schema
-                        
-                        # We have all the information, proceed with extraction
-                        confirmation = f"Great! I'll extract the following data:\n\n"
-                        confirmation += f"- Prompt: {prompt}\n"
-                        confirmation += f"- URLs: {', '.join(urls)}\n"
-                        confirmation += f"- Schema: {json.dumps(schema, indent=2)}\n\n"
-                        confirmation += "Processing your request now..."
-                        
-                        # Proceed with extraction
-                        try:
-                            # Build scrape options
-                            scrape_options = {
-                                "formats": [self.valves.DEFAULT_FORMAT],
-                                "onlyMainContent": self.valves.ONLY_MAIN_CONTENT,
-                                "waitFor": self.valves.WAIT_FOR,
-                                "mobile": self.valves.MOBILE,
-                                "timeout": self.valves.TIMEOUT,
-                                "removeBase64Images": self.valves.REMOVE_BASE64_IMAGES,
-                                "blockAds": self.valves.BLOCK_ADS
-                            }
-                            
-                            # Add location if specified
-                            location = self._parse_location(self.valves.LOCATION_COUNTRY, self.valves.LOCATION_LANGUAGES)
-                            if location:
-                                scrape_options["location"] = location
-                            
-                            # Create request with all parameters
-                            request_data = {
-                                "urls": urls,
-                                "prompt": prompt,
-                                "schema": schema,
-                                "enableWebSearch": self.valves.ENABLE_WEB_SEARCH,
-                                "ignoreSitemap": self.valves.IGNORE_SITEMAP,
-                                "includeSubdomains": self.valves.INCLUDE_SUBDOMAINS,
-                                "showSources": self.valves.SHOW_SOURCES,
-                                "scrapeOptions": scrape_options
-                            }
-                            
-                            # For debugging, show the exact request that will be sent
-                            if self._debug:
-                                logger.debug(f"Raw request data: {json.dumps(request_data, indent=2)}")
-                            
-                            request = ExtractRequest(**request_data)
-                            
-                            if self._debug:
-                                logger.debug(f"Created extract request: {request.model_dump()}")
-                            
-                            response = self.client.extract_data(request)
-                            
-                            if self._debug:
-                                logger.debug(f"Received extract response: {response.model_dump()}")
-                            
-                            # Reset conversation state after successful extraction
-                            self._conversation_state = {}
-                            
-                            # Return success message with extraction ID
-                            return (f"{confirmation}\n\nExtraction job started with ID: {response.id}. Status: {'successful' if response.success else 'failed'}\n\n"
-                                   f"To check the status and results later, ask: 'Check status of {response.id}'")
-                        except Exception as e:
-                            error_msg = f"Error during extraction operation: {str(e)}"
-                            logger.error(error_msg)
-                            
-                            if self._debug:
-                                logger.error(traceback.format_exc())
-                                return f"{error_msg}\n\nDebug traceback:\n{traceback.format_exc()}"
-                            
-                            return error_msg
-                    
-                    # If we have prompt and URLs but no schema, ask for schema
-                    complex_example = {
-                        "type": "object",
-                        "properties": {
-                            "founders": {
-                                "type": "array",
-                                "items": {
-                                    "type": "object",
-                                    "properties": {
-                                        "name": {
-                                            "type": "string"
-                                        }
-                                    },
-                                    "required": [
-                                        "name"
-                                    ]
-                                }
-                            }
-                        },
-                        "required": [
-                            "founders"
-                        ]
-                    }
-                    
-                    return f"Great! I'll extract: '{prompt}'\n\nNow, please provide ONLY the JSON schema for the data in your next message.\n\nHere's an example schema that would extract an array of founders with their names:\n\n```json\n{json.dumps(complex_example, indent=2)}\n```"
-                else:
-                    return f"Great! I'll extract: '{prompt}'\n\nNow, please provide the URL(s) of the website(s) you want to extract data from."
-            else:
-                # If no clear prompt was found, ask explicitly
-                return "Please tell me what you want to extract from the website. For example: 'Extract the founder's name' or 'Find product prices and descriptions'."
-        
-        # Step 2: Get the URLs if not already provided
-        if "prompt" in self._conversation_state and "urls" not in self._conversation_state:
-            urls = self._extract_urls_from_message(user_message)
-            if urls:
-                self._conversation_state["urls"] = urls
-                
-                # Provide complex schema example
-                complex_example = {
-                    "type": "object",
-                    "properties": {
-                        "founders": {
-                            "type": "array",
-                            "items": {
-                                "type": "object",
-                                "properties": {
-                                    "name": {
-                                        "type": "string"
-                                    }
-                                },
-                                "required": [
-                                    "name"
-                                ]
-                            }
-                        }
-                    },
-                    "required": [
-                        "founders"
-                    ]
-                }
-                
-                return f"Thanks for the URL(s). Now, please provide ONLY the JSON schema for the data in your next message.\n\nHere's an example schema that would extract an array of founders with their names:\n\n```json\n{json.dumps(complex_example, indent=2)}\n```"
-            else:
-                return "I need the URL(s) of the website(s) you want to extract data from. Please provide at least one valid URL."
-        
-        # Step 3: Get the schema
-        if "prompt" in self._conversation_state and "urls" in self._conversation_state and "schema" not in self._conversation_state:
-            schema = self._extract_schema_from_message(user_message)
-            
-            # If no schema was found or it's empty, ask explicitly
-            if not schema:
-                schema_example = {
-                    "type": "object",
-                    "properties": {
-                        "founders": {
-                            "type": "array",
-                            "items": {
-                                "type": "object",
-                                "properties": {
-                                    "name": {
-                                        "type": "string"
-                                    }
-                                },
-                                "required": [
-                                    "name"
-                                ]
-                            }
-                        }
-                    },
-                    "required": [
-                        "founders"
-                    ]
-                }
-                
-                return f"I need a valid JSON schema to structure the extracted data. Please provide ONLY the schema JSON in your next message.\n\nHere's an example schema that would extract an array of founders with their names:\n\n```json\n{json.dumps(schema_example, indent=2)}\n```\n\nPlease refer to the documentation or the example above for the proper schema format."
-            
-            self._conversation_state["schema"] = schema
-            
-            # Now we have all required information, confirm and proceed
-            prompt = self._conversation_state["prompt"]
-            urls = self._conversation_state["urls"]
-            
-            confirmation = f"Great! I'll extract the following data:\n\n"
-            confirmation += f"- Prompt: {prompt}\n"
-            confirmation += f"- URLs: {', '.join(urls)}\n"
-            confirmation += f"- Schema: {json.dumps(schema, indent=2)}\n\n"
-            confirmation += "Processing your request now..."
-            
-            # Proceed with extraction
-            try:
-                # Build scrape options
-                scrape_options = {
-                    "formats": [self.valves.DEFAULT_FORMAT],
-                    "onlyMainContent": self.valves.ONLY_MAIN_CONTENT,
-                    "waitFor": self.valves.WAIT_FOR,
-                    "mobile": self.valves.MOBILE,
-                    "timeout": self.valves.TIMEOUT,
-                    "removeBase64Images": self.valves.REMOVE_BASE64_IMAGES,
-                    "blockAds": self.valves.BLOCK_ADS
-                }
-                
-                # Add location if specified
-                location = self._parse_location(self.valves.LOCATION_COUNTRY, self.valves.LOCATION_LANGUAGES)
-                if location:
-                    scrape_options["location"] = location
-                
-                # Create request with all parameters
-                request_data = {
-                    "urls": urls,
-                    "prompt": prompt,
-                    "schema": schema,
-                    "enableWebSearch": self.valves.ENABLE_WEB_SEARCH,
-                    "ignoreSitemap": self.valves.IGNORE_SITEMAP,
-                    "includeSubdomains": self.valves.INCLUDE_SUBDOMAINS,
-                    "showSources": self.valves.SHOW_SOURCES,
-                    "scrapeOptions": scrape_options
-                }
-                
-                # For debugging, show the exact request that will be sent
-                if self._debug:
-                    logger.debug(f"Raw request data: {json.dumps(request_data, indent=2)}")
-                
-                request = ExtractRequest(**request_data)
-                
-                if self._debug:
-                    logger.debug(f"Created extract request: {request.model_dump()}")
-                
-                response = self.client.extract_data(request)
-                
-                if self._debug:
-                    logger.debug(f"Received extract response: {response.model_dump()}")
-                
-                # Reset conversation state after successful extraction
-                self._conversation_state = {}
-                
-                # Return success message with extraction ID
-                return (f"{confirmation}\n\nExtraction job started with ID: {response.id}. Status: {'successful' if response.success else 'failed'}\n\n"
-                       f"To check the status and results later, ask: 'Check status of {response.id}'")
-            except Exception as e:
-                error_msg = f"Error during extraction operation: {str(e)}"
-                logger.error(error_msg)
-                
-                if self._debug:
-                    logger.error(traceback.format_exc())
-                    return f"{error_msg}\n\nDebug traceback:\n{traceback.format_exc()}"
-                
-                return error_msg
-        
-        # If we already have all the information, check if the user is providing new information
-        if "prompt" in self._conversation_state and "urls" in self._conversation_state and "schema" in self._conversation_state:
-            # Check if user is providing new URLs
-            urls = self._extract_urls_from_message(user_message)
-            if urls:
-                self._conversation_state["urls"] = urls
-                return f"I've updated the URLs to: {', '.join(urls)}. Do you want to proceed with the extraction using the current prompt and schema?"
-            
-            # Check if user is providing a new schema
-            schema = self._extract_schema_from_message(user_message)
-            if schema:
-                self._conversation_state["schema"] = schema
-                return f"I've updated the schema to: {json.dumps(schema, indent=2)}. Do you want to proceed with the extraction using the current prompt and URLs?"
-            
-            # Check if user is providing a new prompt
-            prompt = self._extract_prompt_from_message(user_message)
-            if prompt and prompt != "Extract the main content and key information from this webpage.":
-                self._conversation_state["prompt"] = prompt
-                return f"I've updated the prompt to: '{prompt}'. Do you want to proceed with the extraction using the current URLs and schema?"
-            
-            # If user confirms or says yes, proceed with extraction
-            if any(keyword in user_message.lower() for keyword in ["yes", "proceed", "continue", "go ahead", "extract", "start"]):
-                prompt = self._conversation_state["prompt"]
-                urls = self._conversation_state["urls"]
-                schema = self._conversation_state["schema"]
-                
-                confirmation = f"Great! I'll extract the following data:\n\n"
-                confirmation += f"- Prompt: {prompt}\n"
-                confirmation += f"- URLs: {', '.join(urls)}\n"
-                confirmation += f"- Schema: {json.dumps(schema, indent=2)}\n\n"
-                confirmation += "Processing your request now..."
-                
-                # Proceed with extraction
-                try:
-                    # Build scrape options
-                    scrape_options = {
-                        "formats": [self.valves.DEFAULT_FORMAT],
-                        "onlyMainContent": self.valves.ONLY_MAIN_CONTENT,
-                        "waitFor": self.valves.WAIT_FOR,
-                        "mobile": self.valves.MOBILE,
-                        "timeout": self.valves.TIMEOUT,
-                        "removeBase64Images": self.valves.REMOVE_BASE64_IMAGES,
-                        "blockAds": self.valves.BLOCK_ADS
-                    }
-                    
-                    # Add location if specified
-                    location = self._parse_location(self.valves.LOCATION_COUNTRY, self.valves.LOCATION_LANGUAGES)
-                    if location:
-                        scrape_options["location"] = location
-                    
-                    # Create request with all parameters
-                    request_data = {
-                        "urls": urls,
-                        "prompt": prompt,
-                        "schema": schema,
-                        "enableWebSearch": self.valves.ENABLE_WEB_SEARCH,
-                        "ignoreSitemap": self.valves.IGNORE_SITEMAP,
-                        "includeSubdomains": self.valves.INCLUDE_SUBDOMAINS,
-                        "showSources": self.valves.SHOW_SOURCES,
-                        "scrapeOptions": scrape_options
-                    }
-                    
-                    # For debugging, show the exact request that will be sent
-                    if self._debug:
-                        logger.debug(f"Raw request data: {json.dumps(request_data, indent=2)}")
-                    
-                    request = ExtractRequest(**request_data)
-                    
-                    if self._debug:
-                        logger.debug(f"Created extract request: {request.model_dump()}")
-                    
-                    response = self.client.extract_data(request)
-                    
-                    if self._debug:
-                        logger.debug(f"Received extract response: {response.model_dump()}")
-                    
-                    # Reset conversation state after successful extraction
-                    self._conversation_state = {}
-                    
-                    # Return success message with extraction ID
-                    return (f"{confirmation}\n\nExtraction job started with ID: {response.id}. Status: {'successful' if response.success else 'failed'}\n\n"
-                           f"To check the status and results later, ask: 'Check status of {response.id}'")
-                except Exception as e:
-                    error_msg = f"Error during extraction operation: {str(e)}"
-                    logger.error(error_msg)
-                    
-                    if self._debug:
-                        logger.error(traceback.format_exc())
-                        return f"{error_msg}\n\nDebug traceback:\n{traceback.format_exc()}"
-                    
-                    return error_msg
-            
-            # If user says no, ask what they want to change
-            if any(keyword in user_message.lower() for keyword in ["no", "change", "modify", "update", "edit"]):
-                return "What would you like to change? You can update the prompt, URLs, or schema."
-            
-            # Default response if we can't determine what the user wants
-            return "I have all the information needed for extraction. Please say 'yes' to proceed, 'no' to make changes, or 'restart' to start over."
+        if "status" in msg_lc or "check" in msg_lc:
+            status_msg = self._check_extract_status(user_message)
+            if status_msg is not None:
+                return status_msg
         
-        # If we reach here, something unexpected happened
-        return "I'm not sure what you want to do. Please say 'restart' to start over, or provide the information I'm asking for."
+        # Handle the conversational flow for extraction, dispatching on which pieces are collected
+        state = self._conversation_state
+        step = self._steps.get(("prompt" in state, "urls" in state, "schema" in state), self._await_prompt)
+        return step(user_message, msg_lc)
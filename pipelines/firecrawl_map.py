@@ -15,13 +15,50 @@ import json
 import requests
 import re
 import traceback
-from typing import List, Union, Generator, Iterator
+from typing import List, Dict, Any, Union, Generator, Iterator
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from pydantic import BaseModel, Field
 from logging import getLogger
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 logger = getLogger(__name__)
 logger.setLevel("DEBUG")
 
+# JSON helpers that use orjson when it is installed and the stdlib otherwise
+def _json_bytes(obj: Any) -> bytes:
+    return orjson.dumps(obj) if orjson else json.dumps(obj).encode()
+
+def _json_pretty(obj: Any) -> str:
+    return orjson.dumps(obj, option=orjson.OPT_INDENT_2).decode() if orjson else json.dumps(obj, indent=2)
+
+def _mask_api_key(api_key: str) -> str:
+    return f"{api_key[:4]}...{api_key[-4:]}" if len(api_key) > 8 else "***"
+
+class _LazyJson:
+    """Defer JSON serialization of debug log arguments until a record is emitted"""
+    __slots__ = ("obj",)
+
+    def __init__(self, obj: Any):
+        self.obj = obj
+
+    def __str__(self) -> str:
+        return _json_pretty(self.obj)
+
+# Message patterns, compiled once at import
+URL_RE = re.compile(r'https?://(?:[-\w.]|(?:%[\da-fA-F]{2}))+')
+# "search for" must come before "search": alternatives are tried leftmost-first
+SEARCH_RE = re.compile(
+    r'(?:search for|search|find|containing|with|include)\s+"([^"]*)"', re.IGNORECASE
+)
+
+# Connections kept alive for map calls running at the same time; the host calls pipe() from worker threads
+MAX_CONCURRENT_MAPS = 8
+
 # Request and Response Models
 class MapRequest(BaseModel):
     url: str
@@ -36,60 +73,74 @@ class MapResponse(BaseModel):
     links: List[str]
 
 class FirecrawlClient:
-    def __init__(self, api_key: str, debug: bool = False):
+    def __init__(self, api_key: str, debug: bool = False, timeout: tuple = (5, 60)):
         self.api_key = api_key
         self.base_url = "https://api.firecrawl.dev/v1"
         self.debug = debug
-
-    def headers(self):
-        return {
-            "Authorization": f"Bearer {self.api_key}",
+        # (connect, read) timeout in seconds; mapping a large site can take a while to answer
+        self.timeout = timeout
+        self._headers = {
+            "Authorization": f"Bearer {api_key}",
             "Content-Type": "application/json",
             "X-Origin": "openwebui",
             "X-Origin-Type": "integration",
         }
 
-    def map_urls(self, request: MapRequest) -> MapResponse:
+        # Keep one pooled session so consecutive and concurrent map calls reuse warm connections
+        self.session = requests.Session()
+        self.session.headers.update(self.headers())
+        retries = Retry(
+            total=3,
+            backoff_factor=0.5,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=["GET", "POST"],
+            raise_on_status=False,
+        )
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=MAX_CONCURRENT_MAPS, max_retries=retries))
+
+    def close(self):
+        self.session.close()
+
+    def headers(self):
+        return self._headers
+
+    def set_api_key(self, api_key: str):
+        self.api_key = api_key
+        self._headers["Authorization"] = f"Bearer {api_key}"
+        self.session.headers["Authorization"] = self._headers["Authorization"]
+
+    def map_urls(self, payload: Dict[str, Any]) -> MapResponse:
         endpoint = "/map"
         url = f"{self.base_url}{endpoint}"
-        headers = self.headers()
         
         if self.debug:
-            logger.debug(f"Map request: {json.dumps(request.model_dump(), indent=2)}")
-            logger.debug(f"Endpoint: {url}")
-            logger.debug(f"Using API key: {self.api_key[:4]}...{self.api_key[-4:] if len(self.api_key) > 8 else ''}")
+            # Only validate the outbound payload against MapRequest while debugging
+            logger.debug("Map request: %s", MapRequest.model_validate(payload))
+            logger.debug("Endpoint: %s", url)
+            logger.debug("Using API key: %s", _mask_api_key(self.api_key))
         
         try:
-            payload = {
-                "url": request.url,
-                "search": request.search,
-                "ignoreSitemap": request.ignoreSitemap,
-                "sitemapOnly": request.sitemapOnly,
-                "includeSubdomains": request.includeSubdomains,
-                "limit": request.limit
-            }
-            
-            response = requests.post(url, json=payload, headers=headers)
+            response = self.session.post(url, data=_json_bytes(payload), timeout=self.timeout)
             
             if self.debug:
-                logger.debug(f"Response status code: {response.status_code}")
-                logger.debug(f"Response headers: {dict(response.headers)}")
+                logger.debug("Response status code: %s", response.status_code)
+                logger.debug("Response headers: %s", response.headers)
             
             response.raise_for_status()
             
-            response_data = response.json()
+            # Validate the body straight into the model without an intermediate dict
+            map_response = MapResponse.model_validate_json(response.content)
             if self.debug:
-                logger.debug(f"Response data: {json.dumps(response_data, indent=2)}")
+                logger.debug("Response data: %s", map_response)
             
-            return MapResponse(**response_data)
+            return map_response
         except requests.exceptions.RequestException as e:
             if self.debug:
-                logger.error(f"Request failed: {str(e)}")
-                if hasattr(e, 'response') and e.response:
-                    logger.error(f"Response status code: {e.response.status_code}")
-                    logger.error(f"Response body: {e.response.text}")
-                logger.error(traceback.format_exc())
-            raise Exception(f"Request failed: {e}")
+                logger.exception("Request failed: %s", e)
+                if getattr(e, 'response', None) is not None:
+                    logger.error("Response status code: %s", e.response.status_code)
+                    logger.error("Response body: %s", e.response.text)
+            raise Exception(f"Request failed: {e}") from e
 
 class Pipe:
     class Valves(BaseModel):
@@ -112,60 +163,60 @@ class Pipe:
 
         # let's print all the valves with a prefix so we know which ones are set
         for k, v in self.valves.model_dump().items():
-            logger.debug(f"Valve item: {k}")
+            logger.debug("Valve item: %s", k)
             if v:
-                logger.debug(f"{k}: {v}")
+                logger.debug("%s: %s", k, _mask_api_key(v) if k == "FIRECRAWL_API_KEY" else v)
             else:
-                logger.debug(f"{k}: not set")
+                logger.debug("%s: not set", k)
 
         
         if self._debug:
-            logger.debug(f"Initialized {self.name} with valves: {self.valves.model_dump()}")
-            api_key = self.valves.FIRECRAWL_API_KEY
-            logger.debug(f"Using API key: {api_key[:4]}...{api_key[-4:] if len(api_key) > 8 else ''}")
+            logger.debug("Initialized %s with valves: %s", self.name, self.valves)
+            logger.debug("Using API key: %s", _mask_api_key(self.valves.FIRECRAWL_API_KEY))
     
     async def on_startup(self):
-        logger.debug(f"on_startup:{self.name}")
+        logger.debug("on_startup:%s", self.name)
         if not self.valves.FIRECRAWL_API_KEY:
             logger.warning("FIRECRAWL_API_KEY not set. Pipeline will not function correctly.")
+        else:
+            self._get_client()
         
         if self._debug:
             logger.debug("Debug mode is enabled. Detailed logs will be shown.")
     
     async def on_shutdown(self):
-        logger.debug(f"on_shutdown:{self.name}")
+        logger.debug("on_shutdown:%s", self.name)
+        if hasattr(self, 'client'):
+            self.client.close()
+    
+    def _get_client(self) -> FirecrawlClient:
+        """Return the shared Firecrawl client, creating it once and following API key changes"""
+        if not hasattr(self, 'client'):
+            self.client = FirecrawlClient(api_key=self.valves.FIRECRAWL_API_KEY, debug=self._debug)
+        elif self.client.api_key != self.valves.FIRECRAWL_API_KEY:
+            self.client.set_api_key(self.valves.FIRECRAWL_API_KEY)
+        return self.client
     
     def _extract_url_from_message(self, message: str) -> str:
-        # Initialize the Firecrawl client
-        self.client = FirecrawlClient(api_key=self.valves.FIRECRAWL_API_KEY, debug=self._debug)
-
         """Extract URL from user message"""
-        url_pattern = r'https?://(?:[-\w.]|(?:%[\da-fA-F]{2}))+'
-        urls = re.findall(url_pattern, message)
+        # Every URL the pattern accepts contains "http"; only the first match is used
+        match = URL_RE.search(message) if "http" in message else None
+        url = match.group(0) if match else None
         
         if self._debug:
-            logger.debug(f"Extracted URLs from message: {urls}")
+            logger.debug("Extracted URL from message: %s", url)
         
-        return urls[0] if urls else None
+        return url
     
     def _extract_search_term(self, message: str) -> str:
         """Extract search term from user message if present"""
-        search_patterns = [
-            r'search for "(.*?)"',
-            r'search "(.*?)"',
-            r'find "(.*?)"',
-            r'containing "(.*?)"',
-            r'with "(.*?)"',
-            r'include "(.*?)"',
-        ]
-        
-        for pattern in search_patterns:
-            match = re.search(pattern, message, re.IGNORECASE)
-            if match:
-                search_term = match.group(1)
-                if self._debug:
-                    logger.debug(f"Extracted search term: {search_term}")
-                return search_term
+        # Search terms are always quoted
+        match = SEARCH_RE.search(message) if '"' in message else None
+        if match:
+            search_term = match.group(1)
+            if self._debug:
+                logger.debug("Extracted search term: %s", search_term)
+            return search_term
         
         if self._debug:
             logger.debug("No search term found in message")
@@ -178,12 +229,12 @@ class Pipe:
         """
         Process the user message and perform map operation using Firecrawl API
         """
-        logger.debug(f"pipe:{__name__}")
+        logger.debug("pipe:%s", __name__)
         
         if self._debug:
-            logger.debug(f"User message: {user_message}")
-            logger.debug(f"Model ID: {model_id}")
-            logger.debug(f"Body: {json.dumps(body, indent=2)}")
+            logger.debug("User message: %s", user_message)
+            logger.debug("Model ID: %s", model_id)
+            logger.debug("Body: %s", _LazyJson(body))
         
         if body.get("title", False):
             return "Firecrawl URL Mapping Pipeline"
@@ -192,20 +243,18 @@ class Pipe:
         if not self.valves.FIRECRAWL_API_KEY:
             return "Error: FIRECRAWL_API_KEY not set. Please set it in your environment variables."
     
-        logger.debug(f"FIRECRAWL_API_KEY: {self.valves.FIRECRAWL_API_KEY}")
+        self._get_client()
         
         # Check if debug command is in the message - only for development
         if "debug on" in user_message.lower():
             self._debug = True
-            if hasattr(self, 'client'):
-                self.client.debug = True
+            self.client.debug = True
             logger.debug("Debug mode enabled")
             return "Debug mode has been enabled. Detailed logs will now be shown."
         
         if "debug off" in user_message.lower():
             self._debug = False
-            if hasattr(self, 'client'):
-                self.client.debug = False
+            self.client.debug = False
             logger.debug("Debug mode disabled")
             return "Debug mode has been disabled."
         
@@ -223,42 +272,40 @@ class Pipe:
         
         # Perform map operation
         try:
-            request = MapRequest(
-                url=url,
-                search=search_term,
-                ignoreSitemap=self.valves.IGNORE_SITEMAP,
-                sitemapOnly=self.valves.SITEMAP_ONLY,
-                includeSubdomains=self.valves.INCLUDE_SUBDOMAINS,
-                limit=self.valves.URL_LIMIT
-            )
-            
-            if self._debug:
-                logger.debug(f"Created map request: {request.model_dump()}")
+            # Inputs come from the valves and our own regexes, so the payload is sent as a plain dict
+            request_data = {
+                "url": url,
+                "search": search_term,
+                "ignoreSitemap": self.valves.IGNORE_SITEMAP,
+                "sitemapOnly": self.valves.SITEMAP_ONLY,
+                "includeSubdomains": self.valves.INCLUDE_SUBDOMAINS,
+                "limit": self.valves.URL_LIMIT
+            }
             
-            response = self.client.map_urls(request)
+            # The client logs and, in debug mode, validates the exact payload it sends
+            response = self.client.map_urls(request_data)
             
             if self._debug:
-                logger.debug(f"Received map response with {len(response.links)} URLs")
-                logger.debug(f"First 5 URLs: {response.links[:5] if len(response.links) >= 5 else response.links}")
+                logger.debug("Received map response with %s URLs", len(response.links))
+                logger.debug("First 5 URLs: %s", response.links[:5] if len(response.links) >= 5 else response.links)
             
             # if there's no search term, just show
             if not search_term:
-                result = f"Found {len(response.links)} URLs on {url}."
-            else:
-                result = f"Found {len(response.links)} URLs on {url} containing '{search_term}'."
-                
-            result += "\n\nList of mapped URLs:"
-            if not response.links:
-                result += "\nNothing was found []"
+                header = f"Found {len(response.links)} URLs on {url}."
             else:
-                result += "\n" + "\n".join(f"- {url}" for url in response.links)
-            return result
+                header = f"Found {len(response.links)} URLs on {url} containing '{search_term}'."
+            
+            # Build the reply in a single join over a pre-sized list
+            lines = ["- " + link for link in response.links] or ["Nothing was found []"]
+            return "\n".join([header, "", "List of mapped URLs:", *lines])
         except Exception as e:
             error_msg = f"Error during map operation: {str(e)}"
-            logger.error(error_msg)
             
             if self._debug:
-                logger.error(traceback.format_exc())
-                return f"{error_msg}\n\nDebug traceback:\n{traceback.format_exc()}"
+                # Format the traceback once and reuse it for the log and the reply
+                tb = traceback.format_exc()
+                logger.error("%s\n%s", error_msg, tb)
+                return f"{error_msg}\n\nDebug traceback:\n{tb}"
             
+            logger.error(error_msg)
             return error_msg
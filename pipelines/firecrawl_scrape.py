@@ -14,14 +14,74 @@ import os
 import json
 import requests
 import re
+import time
+import hashlib
+import tempfile
 import traceback
 from typing import List, Dict, Any, Union, Generator, Iterator
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from pydantic import BaseModel, Field
 from logging import getLogger
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 logger = getLogger(__name__)
 logger.setLevel("DEBUG")
 
+# JSON helpers that use orjson when it is installed and the stdlib otherwise
+def _json_loads(data: Union[bytes, str]) -> Any:
+    return orjson.loads(data) if orjson else json.loads(data)
+
+def _json_bytes(obj: Any) -> bytes:
+    return orjson.dumps(obj) if orjson else json.dumps(obj).encode()
+
+def _json_pretty(obj: Any) -> str:
+    return orjson.dumps(obj, option=orjson.OPT_INDENT_2).decode() if orjson else json.dumps(obj, indent=2)
+
+def _cache_key(payload: Dict[str, Any]) -> str:
+    """Hash a request payload independently of its key order"""
+    data = orjson.dumps(payload, option=orjson.OPT_SORT_KEYS) if orjson else json.dumps(payload, sort_keys=True).encode()
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+def _body_text(response: requests.Response, limit: Union[int, None] = None) -> str:
+    """Decode a Firecrawl response body, or just its first limit bytes, as UTF-8 without requests' charset detection"""
+    content = response.content if limit is None else response.content[:limit]
+    return content.decode(errors="replace")
+
+def _mask_api_key(api_key: str) -> str:
+    return f"{api_key[:4]}...{api_key[-4:]}" if len(api_key) > 8 else "***"
+
+class _LazyJson:
+    """Defer JSON serialization of debug log arguments until a record is emitted"""
+    __slots__ = ("obj",)
+
+    def __init__(self, obj: Any):
+        self.obj = obj
+
+    def __str__(self) -> str:
+        return _json_pretty(self.obj)
+
+# Message patterns, compiled once at import
+URL_RE = re.compile(r'https?://(?:[-\w.]|(?:%[\da-fA-F]{2}))+')
+GREETING_RE = re.compile(r'^(?:hi|hello|hey|start|begin|help)(?:\s|$)', re.IGNORECASE)
+API_KEY_RE = re.compile(r'set api key[:\s]+([a-zA-Z0-9_\-]+)', re.IGNORECASE)
+CMD_RE = re.compile(r'\b(debug on|debug off|debug status|set api key)\b')
+
+# Statuses the session retries with backoff; a response still carrying one after the retries is reported as a failed scrape
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Connections kept alive for scrapes running at the same time; the host calls pipe() from worker threads
+MAX_CONCURRENT_SCRAPES = 10
+
+# Seconds between batch scrape status polls, and how long to wait for a batch before giving up
+BATCH_POLL_INTERVAL = 2.0
+BATCH_SCRAPE_TIMEOUT = 300.0
+TERMINAL_STATUSES = ("completed", "failed", "cancelled")
+
 # Request and Response Models
 class ScrapeRequest(BaseModel):
     url: str
@@ -46,88 +106,301 @@ class ScrapeResponse(BaseModel):
     data: Dict[str, Any] = Field(default_factory=dict)
     error: str | None = None
 
+class BatchScrapeRequest(ScrapeRequest):
+    # A batch names its pages in urls and applies every other scrape option to all of them
+    url: str | None = None
+    urls: List[str]
+
+class BatchScrapeResponse(BaseModel):
+    success: bool
+    id: str | None = None
+    invalidURLs: List[str] = Field(default_factory=list)
+    error: str | None = None
+
+class BatchScrapeStatusResponse(BaseModel):
+    # Firecrawl answers unknown or expired jobs with {"success": false, "error": ...} and no status
+    success: bool = True
+    status: str = "error"
+    total: int = 0
+    completed: int = 0
+    next: str | None = None
+    data: List[Dict[str, Any]] = Field(default_factory=list)
+    error: str | None = None  # For error responses
+
 class FirecrawlClient:
     def __init__(self, api_key: str, debug: bool = False):
         self.api_key = api_key
         self.base_url = "https://api.firecrawl.dev/v1"
         self.debug = debug
-
-    def headers(self):
-        return {
-            "Authorization": f"Bearer {self.api_key}",
+        self._headers = {
+            "Authorization": f"Bearer {api_key}",
             "Content-Type": "application/json",
             "X-Origin": "openwebui",
             "X-Origin-Type": "integration",
         }
 
-    def scrape_and_extract_from_url(self, request: ScrapeRequest) -> ScrapeResponse:
+        # Keep one pooled session so consecutive and concurrent scrapes reuse warm connections
+        self.session = requests.Session()
+        self.session.headers.update(self.headers())
+        # Rate limits and transient 5xx answers are retried, but a read timeout is not: Firecrawl may still be
+        # working on (and billing) the scrape, and each resend would block the worker for another full timeout
+        retries = Retry(
+            total=5,
+            read=0,
+            backoff_factor=0.5,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=["POST"],
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=MAX_CONCURRENT_SCRAPES, max_retries=retries))
+        # Every batch job started is billed per URL, so a POST to /batch/scrape must not be resent after a slow or
+        # failed response; only connection errors and the status GETs polled under the same prefix are retried
+        batch_retries = Retry(
+            total=3,
+            backoff_factor=0.5,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=["GET"],
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        self.session.mount(
+            f"{self.base_url}/batch/scrape",
+            HTTPAdapter(pool_connections=1, pool_maxsize=MAX_CONCURRENT_SCRAPES, max_retries=batch_retries),
+        )
+
+    def close(self):
+        self.session.close()
+
+    def headers(self):
+        return self._headers
+
+    def set_api_key(self, api_key: str):
+        self.api_key = api_key
+        self._headers["Authorization"] = f"Bearer {api_key}"
+        self.session.headers["Authorization"] = self._headers["Authorization"]
+
+    def _error_message(self, response: requests.Response) -> str:
+        """Pull the error message out of a failed Firecrawl response"""
+        try:
+            return _json_loads(response.content).get("error", "Unknown error")
+        except (ValueError, AttributeError):
+            return f"Error {response.status_code}: {_body_text(response)}"
+
+    def _request_error(self, e: requests.exceptions.RequestException) -> Exception:
+        """Log a failed request while debugging and wrap it for the pipe's error reply"""
+        if self.debug:
+            # logger.exception formats the traceback only when debugging
+            logger.exception("Request failed: %s", e)
+            if getattr(e, 'response', None) is not None:
+                logger.error("Response status code: %s", e.response.status_code)
+                logger.error("Response body: %s", _body_text(e.response))
+                
+                # Try to parse the error response as JSON for more details
+                try:
+                    error_json = _json_loads(e.response.content)
+                    logger.error("Error details: %s", _LazyJson(error_json))
+                except ValueError:
+                    pass
+        return Exception(f"Request failed: {e}")
+
+    def _read_cache(self, path: str, ttl: int) -> Union[bytes, None]:
+        """Return a cached response body, or None when it is missing or older than ttl seconds (0 never expires)"""
+        try:
+            if ttl > 0 and time.time() - os.stat(path).st_mtime > ttl:
+                return None
+            with open(path, "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _write_cache(self, path: str, content: bytes):
+        """Write a response body next to its final path and move it into place atomically"""
+        try:
+            cache_dir = os.path.dirname(path)
+            os.makedirs(cache_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(content)
+                os.replace(tmp_path, path)
+            except OSError:
+                os.unlink(tmp_path)
+                raise
+        except OSError as e:
+            logger.warning("Could not write scrape cache entry %s: %s", path, e)
+
+    def scrape_and_extract_from_url(self, payload: Dict[str, Any], cache_dir: str = "", cache_ttl: int = 0) -> ScrapeResponse:
         endpoint = "/scrape"
         url = f"{self.base_url}{endpoint}"
-        headers = self.headers()
         
         if self.debug:
-            logger.debug(f"Scrape request: {json.dumps(request.model_dump(), indent=2)}")
-            logger.debug(f"Endpoint: {url}")
-            logger.debug(f"Using API key: {self.api_key[:4]}...{self.api_key[-4:] if len(self.api_key) > 8 else ''}")
+            # Only validate the outbound payload against ScrapeRequest while debugging
+            logger.debug("Scrape request: %s", ScrapeRequest.model_validate(payload))
+            logger.debug("Endpoint: %s", url)
+            logger.debug("Using API key: %s", _mask_api_key(self.api_key))
+        
+        # Identical payloads give identical scrapes, so a fresh cached body can stand in for the API call
+        cache_path = os.path.join(cache_dir, _cache_key(payload) + ".json") if cache_dir else None
+        if cache_path:
+            cached = self._read_cache(cache_path, cache_ttl)
+            if cached is not None:
+                try:
+                    scrape_response = ScrapeResponse.model_validate_json(cached)
+                    if self.debug:
+                        logger.debug("Using cached response: %s", cache_path)
+                    return scrape_response
+                except ValueError:
+                    logger.warning("Ignoring unreadable scrape cache entry: %s", cache_path)
         
         try:
-            # Convert the request to a dictionary and then to JSON for better control
-            payload = request.model_dump()
-            
             if self.debug:
-                logger.debug(f"Request payload: {json.dumps(payload, indent=2)}")
+                logger.debug("Request payload: %s", _LazyJson(payload))
             
-            response = requests.post(url, json=payload, headers=headers)
+            # Firecrawl may spend up to the request's timeout on the page, so only time out a while after that
+            read_timeout = payload.get("timeout", 30000) / 1000 + 5
+            response = self.session.post(url, data=_json_bytes(payload), timeout=(5, read_timeout))
             
             if self.debug:
-                logger.debug(f"Response status code: {response.status_code}")
-                logger.debug(f"Response headers: {dict(response.headers)}")
-                logger.debug(f"Response content: {response.text}")
+                logger.debug("Response status code: %s", response.status_code)
+                logger.debug("Response headers: %s", response.headers)
+                # Scraped pages can run to megabytes; only decode the part that gets logged
+                logger.debug("Response content (%d bytes): %s", len(response.content), _body_text(response, 2000))
             
-            # Handle error responses (402, 429, 500)
-            if response.status_code in [402, 429, 500]:
-                try:
-                    error_data = response.json()
-                    error_message = error_data.get("error", "Unknown error")
-                    return ScrapeResponse(success=False, error=error_message)
-                except:
-                    return ScrapeResponse(success=False, error=f"Error {response.status_code}: {response.text}")
+            # Handle payment errors and responses still failing after the session's retries
+            if response.status_code == 402 or response.status_code in RETRY_STATUSES:
+                return ScrapeResponse(success=False, error=self._error_message(response))
             
             # Handle 400 errors with more detailed information
             if response.status_code == 400:
                 error_detail = "Unknown error"
                 try:
-                    error_data = response.json()
-                    error_detail = json.dumps(error_data, indent=2)
+                    error_data = _json_loads(response.content)
+                    error_detail = _json_pretty(error_data)
                 except:
-                    error_detail = response.text
+                    error_detail = _body_text(response)
                 
-                logger.error(f"400 Bad Request Error: {error_detail}")
+                logger.error("400 Bad Request Error: %s", error_detail)
                 raise Exception(f"API returned 400 Bad Request: {error_detail}")
             
             response.raise_for_status()
             
-            response_data = response.json()
+            # Validate the body straight into the model without an intermediate dict
+            scrape_response = ScrapeResponse.model_validate_json(response.content)
+            if self.debug:
+                logger.debug("Response data: %s", scrape_response)
+            
+            # Only successful scrapes are worth replaying
+            if cache_path and scrape_response.success:
+                self._write_cache(cache_path, response.content)
+            
+            return scrape_response
+        except requests.exceptions.RequestException as e:
+            raise self._request_error(e) from e
+
+    def start_batch_scrape(self, payload: Dict[str, Any]) -> BatchScrapeResponse:
+        endpoint = "/batch/scrape"
+        url = f"{self.base_url}{endpoint}"
+        
+        if self.debug:
+            # Only validate the outbound payload against BatchScrapeRequest while debugging
+            logger.debug("Batch scrape request: %s", BatchScrapeRequest.model_validate(payload))
+            logger.debug("Endpoint: %s", url)
+            logger.debug("Using API key: %s", _mask_api_key(self.api_key))
+            logger.debug("Request payload: %s", _LazyJson(payload))
+        
+        try:
+            # Starting a batch only queues the job, so the default read timeout applies
+            response = self.session.post(url, data=_json_bytes(payload), timeout=(5, 30))
+            
+            if self.debug:
+                logger.debug("Response status code: %s", response.status_code)
+                logger.debug("Response content (%d bytes): %s", len(response.content), _body_text(response, 2000))
+            
+            if response.status_code == 402 or response.status_code in RETRY_STATUSES:
+                return BatchScrapeResponse(success=False, error=self._error_message(response))
+            
+            response.raise_for_status()
+            
+            batch_response = BatchScrapeResponse.model_validate_json(response.content)
             if self.debug:
-                logger.debug(f"Response data: {json.dumps(response_data, indent=2)}")
+                logger.debug("Response data: %s", batch_response)
             
-            return ScrapeResponse(**response_data)
+            return batch_response
         except requests.exceptions.RequestException as e:
+            raise self._request_error(e) from e
+
+    def get_batch_scrape_status(self, url: str) -> BatchScrapeStatusResponse:
+        """Fetch a batch's status, or the page of its results at a "next" URL"""
+        if self.debug:
+            logger.debug("Batch scrape status request: %s", url)
+        
+        try:
+            response = self.session.get(url, timeout=(5, 30))
+            
+            if self.debug:
+                logger.debug("Response status code: %s", response.status_code)
+                logger.debug("Response content (%d bytes): %s", len(response.content), _body_text(response, 2000))
+            
+            if response.status_code == 402 or response.status_code in RETRY_STATUSES:
+                return BatchScrapeStatusResponse(status="error", error=self._error_message(response))
+            
+            response.raise_for_status()
+            
+            status_response = BatchScrapeStatusResponse.model_validate_json(response.content)
             if self.debug:
-                logger.error(f"Request failed: {str(e)}")
-                if hasattr(e, 'response') and e.response:
-                    logger.error(f"Response status code: {e.response.status_code}")
-                    logger.error(f"Response body: {e.response.text}")
-                    
-                    # Try to parse the error response as JSON for more details
-                    try:
-                        error_json = e.response.json()
-                        logger.error(f"Error details: {json.dumps(error_json, indent=2)}")
-                    except:
-                        pass
-                        
-                logger.error(traceback.format_exc())
-            raise Exception(f"Request failed: {e}")
+                logger.debug("Response data summary: Status: %s, Total: %s, Completed: %s", status_response.status, status_response.total, status_response.completed)
+            
+            if not status_response.success and not status_response.error:
+                status_response.error = "Batch scrape status is unavailable"
+            
+            return status_response
+        except requests.exceptions.RequestException as e:
+            raise self._request_error(e) from e
+
+    def cancel_batch_scrape(self, batch_id: str):
+        """Ask Firecrawl to stop a batch job; failures are only logged since nobody is waiting on the job anymore"""
+        url = f"{self.base_url}/batch/scrape/{batch_id}"
+        if self.debug:
+            logger.debug("Cancelling batch scrape: %s", url)
+        
+        try:
+            response = self.session.delete(url, timeout=(5, 30))
+            if not response.ok:
+                logger.warning("Could not cancel batch scrape %s: %s", batch_id, self._error_message(response))
+        except requests.exceptions.RequestException as e:
+            logger.warning("Could not cancel batch scrape %s: %s", batch_id, e)
+
+    def batch_scrape(self, payload: Dict[str, Any], timeout: float = BATCH_SCRAPE_TIMEOUT) -> BatchScrapeStatusResponse:
+        """Scrape several URLs in one batch job and wait up to timeout seconds for its results"""
+        batch = self.start_batch_scrape(payload)
+        if not batch.success or not batch.id:
+            return BatchScrapeStatusResponse(status="error", error=batch.error or "Batch scrape was not started")
+        
+        if batch.invalidURLs:
+            logger.warning("Firecrawl rejected invalid URLs: %s", batch.invalidURLs)
+        
+        status_url = f"{self.base_url}/batch/scrape/{batch.id}"
+        deadline = time.monotonic() + timeout
+        status = self.get_batch_scrape_status(status_url)
+        while not status.error and status.status not in TERMINAL_STATUSES and time.monotonic() < deadline:
+            time.sleep(BATCH_POLL_INTERVAL)
+            status = self.get_batch_scrape_status(status_url)
+        
+        # Stop a job nobody will collect instead of letting it keep scraping (and billing) in the background
+        if not status.error and status.status not in TERMINAL_STATUSES:
+            self.cancel_batch_scrape(batch.id)
+        
+        # Large results are split into pages linked through "next"
+        while status.status == "completed" and status.next:
+            page = self.get_batch_scrape_status(status.next)
+            if page.error:
+                status.error = page.error
+                break
+            status.data.extend(page.data)
+            status.next = page.next
+        
+        return status
 
 class Pipe:
     class Valves(BaseModel):
@@ -146,8 +419,22 @@ class Pipe:
         LOCATION_COUNTRY: str = Field(default="US", description="Country for location-based scraping")
         LOCATION_LANGUAGES: str = Field(default="en-US", description="Comma-separated list of languages to scrape")
         ACTIONS: str = Field(default="", description="Comma-separated list of actions to perform. Eg. ({ 'type': 'wait', 'milliseconds': 2, 'selector': '#my-element' }, { 'type': 'wait', 'milliseconds': 10, 'selector': '#my-other-element' })")
+        CACHE_DIR: str = Field(default="", description="Directory to cache successful scrape responses in (empty disables the cache)")
+        CACHE_TTL: int = Field(default=3600, description="Seconds a cached scrape response stays valid (0 never expires)")
         # JSON_OPTIONS: str = Field(default="", description="Object of JSON options to send with the request")
     
+    # Environment-resolved and type-coerced valve defaults, shared by all instances
+    _valve_defaults: Dict[str, Any] | None = None
+    
+    @classmethod
+    def _resolve_valve_defaults(cls) -> Dict[str, Any]:
+        """Read valve overrides from the environment once per process"""
+        if cls._valve_defaults is None:
+            cls._valve_defaults = cls.Valves(
+                **{k: os.getenv(k, v.default) for k, v in cls.Valves.model_fields.items()}
+            ).model_dump()
+        return cls._valve_defaults
+    
     def __init__(self):
         self.name = "Firecrawl Web Scraping Pipeline"
         
@@ -155,108 +442,145 @@ class Pipe:
         self._debug = False
         
         # Initialize valve parameters
-        self.valves = self.Valves(
-            **{k: os.getenv(k, v.default) for k, v in self.Valves.model_fields.items()}
-        )
+        self.valves = self.Valves(**self._resolve_valve_defaults())
+        
+        # Request fields built by _get_request_options and the valve values they were built from
+        self._request_options = None
+        self._request_options_fingerprint = None
+        
+        # Chat command handlers keyed by the token matched in CMD_RE, in precedence order
+        self._commands = {
+            "set api key": self._set_api_key,
+            "debug on": self._debug_on,
+            "debug off": self._debug_off,
+            "debug status": self._debug_status,
+        }
         
         if self._debug:
-            logger.debug(f"Initialized {self.name} with valves: {self.valves.model_dump()}")
+            logger.debug("Initialized %s with valves: %s", self.name, self.valves)
             if not self.valves.FIRECRAWL_API_KEY:
                 logger.warning("FIRECRAWL_API_KEY is not set or empty")
             else:
-                api_key = self.valves.FIRECRAWL_API_KEY
-                logger.debug(f"Using API key: {api_key[:4]}...{api_key[-4:] if len(api_key) > 8 else ''}")
+                logger.debug("Using API key: %s", _mask_api_key(self.valves.FIRECRAWL_API_KEY))
     
     async def on_startup(self):
-        logger.debug(f"on_startup:{self.name}")
+        logger.debug("on_startup:%s", self.name)
         if not self.valves.FIRECRAWL_API_KEY:
             logger.warning("FIRECRAWL_API_KEY not set. Pipeline will not function correctly.")
+        else:
+            self._get_client()
         
         if self._debug:
             logger.debug("Debug mode is enabled. Detailed logs will be shown.")
     
     async def on_shutdown(self):
-        logger.debug(f"on_shutdown:{self.name}")
+        logger.debug("on_shutdown:%s", self.name)
+        if hasattr(self, 'client'):
+            self.client.close()
     
-    def _extract_url_from_message(self, message: str) -> str:
-        # Initialize the Firecrawl client
-        self.client = FirecrawlClient(api_key=self.valves.FIRECRAWL_API_KEY, debug=self._debug)
-
-        """Extract URL from user message"""
-        url_pattern = r'https?://(?:[-\w.]|(?:%[\da-fA-F]{2}))+'
-        urls = re.findall(url_pattern, message)
+    def _get_client(self) -> FirecrawlClient:
+        """Return the shared Firecrawl client, creating it once and following API key changes"""
+        if not hasattr(self, 'client'):
+            self.client = FirecrawlClient(api_key=self.valves.FIRECRAWL_API_KEY, debug=self._debug)
+        elif self.client.api_key != self.valves.FIRECRAWL_API_KEY:
+            self.client.set_api_key(self.valves.FIRECRAWL_API_KEY)
+        return self.client
+    
+    def _extract_urls_from_message(self, message: str) -> List[str]:
+        """Extract the distinct URLs from user message, in order of appearance"""
+        # Every URL the pattern accepts contains "http"
+        urls = list(dict.fromkeys(URL_RE.findall(message))) if "http" in message else []
         
         if self._debug:
-            logger.debug(f"Extracted URLs from message: {urls}")
+            logger.debug("Extracted URLs from message: %s", urls)
         
-        return urls[0] if urls else None
+        return urls
     
-    def _format_scrape_result(self, result: Dict[str, Any], format_type: str = "markdown") -> str:
-        """Format the scrape result for display"""
+    def _format_scrape_result(self, data: Dict[str, Any], format_type: str = "markdown") -> str:
+        """Format the data of a scrape response for display"""
         if self._debug:
-            logger.debug(f"Formatting result for format: {format_type}")
-            logger.debug(f"Result keys: {result.keys() if result else None}")
+            logger.debug("Formatting result for format: %s", format_type)
+            logger.debug("Data keys: %s", data.keys() if data else None)
         
-        if not result or not result.get("data"):
+        if not data:
             return "No content was extracted from the URL."
         
-        data = result["data"]
-        
         if not data.get(format_type):
             return "No content was extracted in the requested format."
         
         content = data[format_type]
         
-        # Build a formatted response
-        response = f"### Extracted Content\n\n{content}\n\n"
+        # Build a formatted response as a list of parts joined once at the end
+        parts = [f"### Extracted Content\n\n{content}\n\n"]
         
         # Add metadata if available
         if data.get("metadata"):
             metadata = data["metadata"]
-            response += "### Metadata\n\n"
+            parts.append("### Metadata\n\n")
             
             if metadata.get("title"):
-                response += f"**Title:** {metadata['title']}\n\n"
+                parts.append(f"**Title:** {metadata['title']}\n\n")
             
             if metadata.get("description"):
-                response += f"**Description:** {metadata['description']}\n\n"
+                parts.append(f"**Description:** {metadata['description']}\n\n")
             
             if metadata.get("language"):
-                response += f"**Language:** {metadata['language']}\n\n"
+                parts.append(f"**Language:** {metadata['language']}\n\n")
         
         # Add links if available
         if data.get("links") and len(data["links"]) > 0:
-            response += "### Links Found\n\n"
-            for i, link in enumerate(data["links"]):
-                response += f"{i+1}. {link}\n"
+            parts.append("### Links Found\n\n")
+            parts.extend(f"{i}. {link}\n" for i, link in enumerate(data["links"], 1))
         
         # Add warning if present
         if data.get("warning"):
-            response += f"\n⚠️ **Warning:** {data['warning']}\n"
+            parts.append(f"\n⚠️ **Warning:** {data['warning']}\n")
+        
+        return "".join(parts)
+    
+    def _format_batch_result(self, pages: List[Dict[str, Any]], format_type: str = "markdown") -> str:
+        """Format the pages of a batch scrape as one section per URL"""
+        if not pages:
+            return "No content was extracted from the URLs."
         
-        return response
+        sections = []
+        for i, page in enumerate(pages, 1):
+            source_url = (page.get("metadata") or {}).get("sourceURL", "Unknown URL")
+            sections.append(f"## {i}. {source_url}\n\n{self._format_scrape_result(page, format_type)}")
+        
+        return "\n---\n\n".join(sections)
     
     def _parse_tag_list(self, tags_str: str) -> List[str]:
         """Parse comma-separated tag list into a list of strings"""
-        if not tags_str or tags_str.strip() == "":
+        if not tags_str:
             return []
         
+        # A single tag (or a blank value) needs no split
+        if "," not in tags_str:
+            tag = tags_str.strip()
+            return [tag] if tag else []
+        
         tags = [t.strip() for t in tags_str.split(',') if t.strip()]
         
         if self._debug:
-            logger.debug(f"Parsed tag list: {tags}")
+            logger.debug("Parsed tag list: %s", tags)
         
         return tags
     
     def _parse_formats(self, formats_str: str) -> List[str]:
         """Parse comma-separated formats into a list of strings"""
-        if not formats_str or formats_str.strip() == "":
+        if not formats_str:
             return ["markdown"]  # Default format
         
+        # A single format (or a blank value) needs no split
+        if "," not in formats_str:
+            format_type = formats_str.strip()
+            return [format_type] if format_type else ["markdown"]
+        
         formats = [f.strip() for f in formats_str.split(',') if f.strip()]
         
         if self._debug:
-            logger.debug(f"Parsed formats: {formats}")
+            logger.debug("Parsed formats: %s", formats)
         
         return formats
     
@@ -266,12 +590,12 @@ class Pipe:
             return {}
         
         try:
-            headers = json.loads(headers_str)
+            headers = _json_loads(headers_str)
             if self._debug:
-                logger.debug(f"Parsed headers: {headers}")
+                logger.debug("Parsed headers: %s", headers)
             return headers
         except json.JSONDecodeError:
-            logger.error(f"Failed to parse headers JSON: {headers_str}")
+            logger.error("Failed to parse headers JSON: %s", headers_str)
             return {}
     
     def _parse_location(self, country: str, languages_str: str) -> Dict[str, Any]:
@@ -287,7 +611,7 @@ class Pipe:
                 location["languages"] = languages
         
         if self._debug:
-            logger.debug(f"Parsed location: {location}")
+            logger.debug("Parsed location: %s", location)
         
         return location
     
@@ -297,45 +621,131 @@ class Pipe:
             return []
         
         try:
-            actions = json.loads(actions_str)
+            actions = _json_loads(actions_str)
             if isinstance(actions, list):
                 if self._debug:
-                    logger.debug(f"Parsed actions: {actions}")
+                    logger.debug("Parsed actions: %s", actions)
                 return actions
             else:
-                logger.error(f"Actions must be a list, got: {type(actions)}")
+                logger.error("Actions must be a list, got: %s", type(actions))
                 return []
         except json.JSONDecodeError:
-            logger.error(f"Failed to parse actions JSON: {actions_str}")
+            logger.error("Failed to parse actions JSON: %s", actions_str)
             return []
 
+    def _get_request_options(self) -> Dict[str, Any]:
+        """Return the valve-derived scrape request fields, reparsed only when the valves change"""
+        valves = self.valves
+        fingerprint = (
+            valves.FORMATS, valves.ONLY_MAIN_CONTENT, valves.INCLUDE_TAGS, valves.EXCLUDE_TAGS, valves.HEADERS,
+            valves.WAIT_FOR, valves.MOBILE, valves.TIMEOUT, valves.BLOCK_ADS, valves.REMOVE_BASE64_IMAGES,
+            valves.PROXY, valves.LOCATION_COUNTRY, valves.LOCATION_LANGUAGES, valves.ACTIONS,
+        )
+        if fingerprint == self._request_options_fingerprint:
+            return self._request_options
+        
+        # Parse all the valve parameters
+        formats = self._parse_formats(valves.FORMATS)
+        include_tags = self._parse_tag_list(valves.INCLUDE_TAGS)
+        exclude_tags = self._parse_tag_list(valves.EXCLUDE_TAGS)
+        headers = self._parse_headers(valves.HEADERS)
+        actions = self._parse_actions(valves.ACTIONS)
+        location = self._parse_location(valves.LOCATION_COUNTRY, valves.LOCATION_LANGUAGES)
+
+        if self._debug:
+            logger.debug("Formats: %s", formats)
+            logger.debug("Include tags: %s", include_tags)
+            logger.debug("Exclude tags: %s", exclude_tags)
+            logger.debug("Headers: %s", headers)
+            logger.debug("Actions: %s", actions)
+            logger.debug("Location: %s", location)
+
+        options = {
+            "formats": formats,
+            "onlyMainContent": valves.ONLY_MAIN_CONTENT,
+            "waitFor": valves.WAIT_FOR,
+            "mobile": valves.MOBILE,
+            "timeout": valves.TIMEOUT,
+            "skipTlsVerification": False,  # Default value
+            "removeBase64Images": valves.REMOVE_BASE64_IMAGES,
+            "blockAds": valves.BLOCK_ADS
+        }
+        
+        # Only add optional parameters if they're not empty
+        if include_tags:
+            options["includeTags"] = include_tags
+        
+        if exclude_tags:
+            options["excludeTags"] = exclude_tags
+            
+        if headers:
+            options["headers"] = headers
+            
+        if actions:
+            options["actions"] = actions
+            
+        if location:
+            options["location"] = location
+            
+        if valves.PROXY:
+            options["proxy"] = valves.PROXY
+        
+        self._request_options_fingerprint = fingerprint
+        self._request_options = options
+        return options
+    
+    def _set_api_key(self, user_message: str) -> str:
+        """Handle the 'set api key' command"""
+        # Extract API key from message
+        match = API_KEY_RE.search(user_message)
+        if match:
+            new_api_key = match.group(1)
+            self.valves.FIRECRAWL_API_KEY = new_api_key
+            self.client.set_api_key(new_api_key)
+            logger.info("API key updated")
+            return f"API key has been updated. First 4 characters: {new_api_key[:4]}..."
+        else:
+            return "Could not extract API key from message. Format should be: set api key YOUR_API_KEY"
+    
+    def _debug_on(self, user_message: str) -> str:
+        """Handle the 'debug on' command - only for development"""
+        self._debug = True
+        self.client.debug = True
+        logger.debug("Debug mode enabled")
+        return "Debug mode has been enabled. Detailed logs will now be shown."
+    
+    def _debug_off(self, user_message: str) -> str:
+        """Handle the 'debug off' command - only for development"""
+        self._debug = False
+        self.client.debug = False
+        logger.debug("Debug mode disabled")
+        return "Debug mode has been disabled."
+    
+    def _debug_status(self, user_message: str) -> str:
+        """Handle the 'debug status' command"""
+        status = "enabled" if self._debug else "disabled"
+        return f"Debug mode is currently {status}."
+
     def pipe(
         self, user_message: str, model_id: str, messages: List[dict], body: dict
     ) -> Union[str, Generator, Iterator]:
         """
         Process the user message and perform scrape operation using Firecrawl API
         """
-        logger.debug(f"pipe:{__name__}")
+        logger.debug("pipe:%s", __name__)
         
         if self._debug:
-            logger.debug(f"User message: {user_message}")
-            logger.debug(f"Model ID: {model_id}")
-            logger.debug(f"Body: {json.dumps(body, indent=2)}")
+            logger.debug("User message: %s", user_message)
+            logger.debug("Model ID: %s", model_id)
+            logger.debug("Body: %s", _LazyJson(body))
         
         if body.get("title", False):
             return "Firecrawl Web Scraping Pipeline"
             
         # Check if this is the first message (empty or just contains a greeting)
-        greeting_patterns = [
-            r'^hi$', r'^hello$', r'^hey$', r'^start$', r'^begin$', r'^help$',
-            r'^hi\s', r'^hello\s', r'^hey\s', r'^start\s', r'^begin\s', r'^help\s'
-        ]
-        
-        is_greeting = not user_message or any(re.search(pattern, user_message.lower()) for pattern in greeting_patterns)
-        
-        if not user_message or is_greeting:
+        if not user_message or GREETING_RE.match(user_message):
             welcome_msg = "👋 Hello! Welcome to the Firecrawl Web Scraping Pipeline.\n\n"
-            welcome_msg += "You can type the URL of a website you want to scrape, and I'll extract its content for you.\n\n"
+            welcome_msg += "You can type the URL of a website you want to scrape, and I'll extract its content for you. Several URLs in one message are scraped together.\n\n"
             welcome_msg += "For example: https://example.com\n\n"
             welcome_msg += "Happy scraping! 🕸️"
             return welcome_msg
@@ -344,117 +754,71 @@ class Pipe:
         if not self.valves.FIRECRAWL_API_KEY:
             return "Error: FIRECRAWL_API_KEY not set. Please set it in your environment variables."
         
-        # Check if API key command is in the message
-        if "set api key" in user_message.lower():
-            # Extract API key from message
-            api_key_pattern = r'set api key[:\s]+([a-zA-Z0-9_\-]+)'
-            match = re.search(api_key_pattern, user_message, re.IGNORECASE)
-            if match:
-                new_api_key = match.group(1)
-                self.valves.FIRECRAWL_API_KEY = new_api_key
-                self.client.api_key = new_api_key
-                logger.info("API key updated")
-                return f"API key has been updated. First 4 characters: {new_api_key[:4]}..."
-            else:
-                return "Could not extract API key from message. Format should be: set api key YOUR_API_KEY"
-        
-        # Check if debug command is in the message - only for development
-        if "debug on" in user_message.lower():
-            self._debug = True
-            self.client.debug = True
-            logger.debug("Debug mode enabled")
-            return "Debug mode has been enabled. Detailed logs will now be shown."
-        
-        if "debug off" in user_message.lower():
-            self._debug = False
-            self.client.debug = False
-            logger.debug("Debug mode disabled")
-            return "Debug mode has been disabled."
-        
-        if "debug status" in user_message.lower():
-            status = "enabled" if self._debug else "disabled"
-            return f"Debug mode is currently {status}."
-        
-        # Extract URL from user message
-        url = self._extract_url_from_message(user_message)
-        if not url:
+        self._get_client()
+        
+        # Dispatch chat commands from a single scan of the lowercased message; when several
+        # commands appear, the first in self._commands wins rather than the first in the text
+        tokens = set(CMD_RE.findall(user_message.lower()))
+        command = next((c for c in self._commands if c in tokens), None)
+        if command:
+            return self._commands[command](user_message)
+        
+        # Extract URLs from user message
+        urls = self._extract_urls_from_message(user_message)
+        if not urls:
             return "No URL found in your message. Please provide a valid URL to scrape."
         
         # Perform scrape operation
         try:
-            # Parse all the valve parameters
-            formats = self._parse_formats(self.valves.FORMATS)
-            include_tags = self._parse_tag_list(self.valves.INCLUDE_TAGS)
-            exclude_tags = self._parse_tag_list(self.valves.EXCLUDE_TAGS)
-            headers = self._parse_headers(self.valves.HEADERS)
-            actions = self._parse_actions(self.valves.ACTIONS)
-            location = self._parse_location(self.valves.LOCATION_COUNTRY, self.valves.LOCATION_LANGUAGES)
-
-            if self._debug:
-                logger.debug(f"Formats: {formats}")
-                logger.debug(f"Include tags: {include_tags}")
-                logger.debug(f"Exclude tags: {exclude_tags}")
-                logger.debug(f"Headers: {headers}")
-                logger.debug(f"Actions: {actions}")
-                logger.debug(f"Location: {location}")
-
-            # Create request with all parameters
-            request_data = {
-                "url": url,
-                "formats": formats,
-                "onlyMainContent": self.valves.ONLY_MAIN_CONTENT,
-                "waitFor": self.valves.WAIT_FOR,
-                "mobile": self.valves.MOBILE,
-                "timeout": self.valves.TIMEOUT,
-                "skipTlsVerification": False,  # Default value
-                "removeBase64Images": self.valves.REMOVE_BASE64_IMAGES,
-                "blockAds": self.valves.BLOCK_ADS
-            }
-            
-            # Only add optional parameters if they're not empty
-            if include_tags:
-                request_data["includeTags"] = include_tags
-            
-            if exclude_tags:
-                request_data["excludeTags"] = exclude_tags
+            # Create request with all parameters; everything but the URLs comes from the valves
+            options = self._get_request_options()
+            formats = options["formats"]
+            format_type = formats[0] if formats else "markdown"
+            
+            # Several URLs go to Firecrawl as one batch job instead of one request each
+            if len(urls) > 1:
+                batch = self.client.batch_scrape({"urls": urls, **options})
                 
-            if headers:
-                request_data["headers"] = headers
+                if self._debug:
+                    logger.debug("Received batch scrape status: %s, %s of %s pages", batch.status, batch.completed, batch.total)
                 
-            if actions:
-                request_data["actions"] = actions
+                if batch.error:
+                    return f"Error during scrape operation: {batch.error}"
                 
-            if location:
-                request_data["location"] = location
+                if batch.status == "failed":
+                    return "Error during scrape operation: the batch scrape failed."
                 
-            if self.valves.PROXY:
-                request_data["proxy"] = self.valves.PROXY
-
-            # For debugging, show the exact request that will be sent
-            if self._debug:
-                logger.debug(f"Raw request data: {json.dumps(request_data, indent=2)}")
-            
-            request = ScrapeRequest(**request_data)
-            
-            if self._debug:
-                logger.debug(f"Created scrape request: {request.model_dump()}")
+                if batch.status == "cancelled":
+                    return "Error during scrape operation: the batch scrape was cancelled."
+                
+                if batch.status != "completed":
+                    return f"The batch scrape did not finish in time: {batch.completed} of {batch.total} pages were scraped."
+                
+                return self._format_batch_result(batch.data, format_type)
             
-            response = self.client.scrape_and_extract_from_url(request)
+            request_data = {"url": urls[0], **options}
+
+            # The client logs and, in debug mode, validates the exact payload it sends
+            response = self.client.scrape_and_extract_from_url(
+                request_data, cache_dir=self.valves.CACHE_DIR, cache_ttl=self.valves.CACHE_TTL
+            )
             
             if self._debug:
-                logger.debug(f"Received scrape response: {response.model_dump()}")
+                logger.debug("Received scrape response: %s", response)
             
             # Check if there was an error
             if response.error:
                 return f"Error during scrape operation: {response.error}"
             
-            return self._format_scrape_result(response.model_dump(), formats[0] if formats else "markdown")
+            return self._format_scrape_result(response.data, format_type)
         except Exception as e:
             error_msg = f"Error during scrape operation: {str(e)}"
-            logger.error(error_msg)
             
             if self._debug:
-                logger.error(traceback.format_exc())
-                return f"{error_msg}\n\nDebug traceback:\n{traceback.format_exc()}"
+                # Format the traceback once and reuse it for the log and the reply
+                tb = traceback.format_exc()
+                logger.error("%s\n%s", error_msg, tb)
+                return f"{error_msg}\n\nDebug traceback:\n{tb}"
             
+            logger.error(error_msg)
             return error_msg